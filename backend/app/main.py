@@ -1,21 +1,31 @@
-import io
+import asyncio
 import os
 import re
+import uuid
 from typing import List, Optional
 
-import pandas as pd
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
+import httpx
 
 # Load environment variables from .env file
 load_dotenv()
 
-from .models import HCPProfile, BatchProfileRequest, EmailDispatchRequest
-from .services.profile_agent import ProfileAgent
+from .models import HCPProfile, BatchProfileRequest, DiscoveryRequest, EmailDispatchRequest
+from .services.profile_agent import BATCH_CONCURRENCY, ProfileAgent
 from .services.emailer import Emailer
-from .services.agents import run_agents_orchestrator
+from .services.adaptive import limit_states
+from .services.agents import close_agent_clients, run_agents_orchestrator
+from .services import diagnostics
+from .services.discovery import NPIDiscovery, discover_npis
+from .services.ingest import MissingNPIColumn, UnsupportedFileType, parse_upload, shutdown_parse_pool
+from .services.prefetch import prefetch_sources
+from .services.profiling import LOOP_LAG_THRESHOLD_MS, ProfilingMiddleware, load_profile, loop_lag_monitor
+from .services.resilience import CircuitOpenError
+from .services.scheduler import default_priority, priority_scope, scheduler_states
+from .services.work_queue import WorkQueue
 
 app = FastAPI(title="HCP Profiling Backend", version="0.1.0")
 
@@ -25,10 +35,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
+app.add_middleware(ProfilingMiddleware)
 
 agent = ProfileAgent()
 emailer = Emailer()
+_work_queue: Optional[WorkQueue] = None
+_diagnostics_task: Optional[asyncio.Task] = None
+_loop_lag_task: Optional[asyncio.Task] = None
+# Strong references so fire-and-forget tasks are not garbage collected mid-run
+_background_tasks: set = set()
+
+
+def _get_work_queue() -> WorkQueue:
+	global _work_queue
+	if _work_queue is None:
+		_work_queue = WorkQueue()
+	return _work_queue
+
+
+def _run_in_background(coro) -> asyncio.Task:
+	task = asyncio.create_task(coro)
+	_background_tasks.add(task)
+	task.add_done_callback(_background_tasks.discard)
+	return task
 
 
 def _normalize_npi(raw: str) -> Optional[str]:
@@ -46,31 +77,49 @@ def _normalize_npi(raw: str) -> Optional[str]:
 	return digits if len(digits) == 10 else None
 
 
+@app.on_event("startup")
+async def startup() -> None:
+    global _diagnostics_task, _loop_lag_task
+    diagnostics.start_tracemalloc()
+    if diagnostics.DIAGNOSTICS_LOG_INTERVAL > 0:
+        _diagnostics_task = asyncio.create_task(diagnostics.periodic_log())
+    if LOOP_LAG_THRESHOLD_MS > 0:
+        _loop_lag_task = asyncio.create_task(loop_lag_monitor.run())
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    for task in (_diagnostics_task, _loop_lag_task):
+        if task is not None:
+            task.cancel()
+    for task in list(_background_tasks):
+        task.cancel()
+    shutdown_parse_pool()
+    await agent.aclose()
+    await close_agent_clients()
+
+
 @app.get("/health")
 async def health() -> JSONResponse:
     return JSONResponse({"status": "ok"})
 
 
 @app.post("/ingest")
-async def ingest_hcps(file: UploadFile = File(...)) -> List[str]:
+async def ingest_hcps(file: UploadFile = File(...), prefetch: bool = False) -> List[str]:
+    """Return the unique, normalized NPIs in the upload.
+
+    With ``prefetch=true`` their NPI Registry and PubMed data is fetched in the
+    background while the list is reviewed, so the profiling call that follows
+    is served mostly from cache.
+    """
     contents = await file.read()
     try:
-        if file.filename.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(io.BytesIO(contents), dtype=str)
-        elif file.filename.endswith(".csv"):
-            df = pd.read_csv(io.BytesIO(contents), dtype=str)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+        raw_values = await parse_upload(file.filename or "", contents)
+    except (UnsupportedFileType, MissingNPIColumn) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=f"Failed to parse file: {exc}") from exc
 
-    lowered = {c.lower(): c for c in df.columns}
-    if "npi" not in lowered and "npi_id" not in lowered:
-        raise HTTPException(status_code=400, detail="Missing required column 'npi' or 'npi_id'")
-
-    npi_column = lowered.get("npi") or lowered.get("npi_id")
-
-    raw_values = df[npi_column].dropna().astype(str).tolist()
     normalized: List[str] = []
     for raw in raw_values:
         npi = _normalize_npi(raw)
@@ -87,6 +136,8 @@ async def ingest_hcps(file: UploadFile = File(...)) -> List[str]:
         if n not in seen:
             unique.append(n)
             seen.add(n)
+    if prefetch:
+        _run_in_background(prefetch_sources(unique))
     return unique
 
 
@@ -94,7 +145,8 @@ async def ingest_hcps(file: UploadFile = File(...)) -> List[str]:
 async def profile_batch(request: BatchProfileRequest) -> List[HCPProfile]:
     if not request.npi_list:
         raise HTTPException(status_code=400, detail="npi_list cannot be empty")
-    profiles = await agent.generate_profiles(request.npi_list, request.max_results_per_source)
+    with priority_scope(request.priority or default_priority(len(request.npi_list))):
+        profiles = await agent.generate_profiles(request.npi_list, request.max_results_per_source, request.depth or "standard", request.budget_ms)
     return profiles
 
 
@@ -102,10 +154,96 @@ async def profile_batch(request: BatchProfileRequest) -> List[HCPProfile]:
 async def profile_agents(request: BatchProfileRequest) -> List[dict]:
     if not request.npi_list:
         raise HTTPException(status_code=400, detail="npi_list cannot be empty")
-    outputs = []
-    for npi in request.npi_list:
-        outputs.append(await run_agents_orchestrator(npi))
-    return outputs
+    batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(npi: str) -> dict:
+        async with batch_slots:
+            return await run_agents_orchestrator(npi, request.depth or "deep", request.confidence_threshold, request.budget_ms)
+
+    with priority_scope(request.priority or default_priority(len(request.npi_list))):
+        outputs = await asyncio.gather(*[one(npi) for npi in request.npi_list])
+    return list(outputs)
+
+
+@app.post("/queue/profile")
+async def enqueue_profiles(request: BatchProfileRequest) -> JSONResponse:
+    """Enqueue NPIs for queue workers (``python -m app.worker``) instead of profiling inline."""
+    if not request.npi_list:
+        raise HTTPException(status_code=400, detail="npi_list cannot be empty")
+    queue = _get_work_queue()
+    batch_id = await asyncio.to_thread(
+        queue.enqueue, request.npi_list, request.depth or "deep", request.confidence_threshold
+    )
+    return JSONResponse({"batch_id": batch_id, "queued": len(request.npi_list)}, status_code=202)
+
+
+@app.get("/queue/{batch_id}")
+async def queue_status(batch_id: str, include_results: bool = False, offset: int = 0, limit: int = 500) -> JSONResponse:
+    """Counts per status; ``include_results`` adds a page of results and failures."""
+    if offset < 0 or not 1 <= limit <= 5000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 5000")
+    status = await asyncio.to_thread(_get_work_queue().batch_status, batch_id, include_results, offset, limit)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown batch_id")
+    return JSONResponse(status)
+
+
+async def _discover_into_queue(filters: dict, max_results: Optional[int], depth: str, batch_id: str) -> None:
+    queue = _get_work_queue()
+    discovery = NPIDiscovery()
+    chunk: List[str] = []
+    try:
+        async for npi in discovery.iter_npis(filters, max_results):
+            chunk.append(npi)
+            if len(chunk) >= 500:
+                await asyncio.to_thread(queue.enqueue, chunk, depth, 70, batch_id)
+                chunk = []
+        if chunk:
+            await asyncio.to_thread(queue.enqueue, chunk, depth, 70, batch_id)
+    except Exception as e:  # noqa: BLE001
+        print(f"[discovery] batch {batch_id} stopped early: {e}")
+    finally:
+        await discovery.aclose()
+
+
+@app.post("/discover")
+async def discover(request: DiscoveryRequest) -> JSONResponse:
+    """Enumerate NPIs from the registry; with ``enqueue`` they stream into the work queue."""
+    filters = request.model_dump(include={"state", "city", "postal_code", "taxonomy_description", "first_name", "last_name"})
+    if not any(filters.values()):
+        raise HTTPException(status_code=400, detail="At least one search filter is required")
+    if request.enqueue:
+        batch_id = uuid.uuid4().hex
+        _run_in_background(_discover_into_queue(filters, request.max_results, request.depth, batch_id))
+        return JSONResponse({"batch_id": batch_id, "status_url": f"/queue/{batch_id}"}, status_code=202)
+    try:
+        npis = await discover_npis(filters, request.max_results)
+    except ValueError as exc:  # includes RegistryQueryError: the registry rejected the filters
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except (CircuitOpenError, httpx.HTTPError) as exc:
+        raise HTTPException(status_code=503, detail=f"NPI Registry unavailable: {exc}") from exc
+    return JSONResponse({"count": len(npis), "npis": npis})
+
+
+@app.get("/admin/diagnostics")
+async def admin_diagnostics(top: int = 10, objects: bool = True) -> JSONResponse:
+    """Resource snapshot: RSS, fds/sockets, event-loop tasks, live clients, tracemalloc top allocations."""
+    return JSONResponse(diagnostics.snapshot(top=top, include_objects=objects))
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_profile(profile_id: str) -> JSONResponse:
+    """Sampling profile of a request sent with ``X-Profile: 1`` (id from its ``X-Profile-Id`` header)."""
+    profile = await asyncio.to_thread(load_profile, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Unknown profile_id")
+    return JSONResponse(profile)
+
+
+@app.get("/admin/limits")
+async def admin_limits() -> JSONResponse:
+    """Current adaptive concurrency limit, in-flight calls and queue depth per upstream."""
+    return JSONResponse({"limits": limit_states(), "schedulers": scheduler_states()})
 
 
 @app.post("/email/dispatch")
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field, EmailStr
 
 
@@ -28,11 +28,39 @@ class HCPProfile(BaseModel):
 	engagementStyle: str = ""
 	confidence: int = 80
 	summary: str = ""
+	# Upstreams that failed or were circuit-broken; the profile is partial
+	skippedSources: List[str] = Field(default_factory=list)
+
+
+# registry: NPI Registry only; standard: + PubMed and web search;
+# deep: + LLM extraction; adaptive: standard, LLM only for low-confidence profiles
+ProfileDepth = Literal["registry", "standard", "deep", "adaptive"]
 
 
 class BatchProfileRequest(BaseModel):
 	npi_list: List[str] = Field(..., min_items=1)
 	max_results_per_source: int = 5
+	# None keeps each endpoint's historical behaviour
+	depth: Optional[ProfileDepth] = None
+	confidence_threshold: int = Field(70, ge=0, le=100)
+	# End-to-end latency budget per profile; defaults to PROFILE_BUDGET_MS (0 = none)
+	budget_ms: Optional[int] = Field(None, gt=0)
+	# Scheduling class for upstream/LLM access; defaults by batch size
+	priority: Optional[Literal["interactive", "standard", "bulk"]] = None
+
+
+class DiscoveryRequest(BaseModel):
+	state: Optional[str] = None
+	city: Optional[str] = None
+	postal_code: Optional[str] = None
+	taxonomy_description: Optional[str] = None
+	first_name: Optional[str] = None
+	# Exact name or trailing wildcard with at least two characters, e.g. "SM*"
+	last_name: Optional[str] = None
+	max_results: Optional[int] = Field(None, gt=0)
+	# Stream discovered NPIs into the work queue instead of returning them
+	enqueue: bool = False
+	depth: ProfileDepth = "deep"
 
 
 class EmailDispatchRequest(BaseModel):
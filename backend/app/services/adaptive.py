@@ -0,0 +1,201 @@
+import asyncio
+import os
+import threading
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+from .latency import BudgetExhausted
+
+ADAPTIVE_INITIAL_LIMIT = float(os.getenv("ADAPTIVE_INITIAL_LIMIT", "4"))
+ADAPTIVE_MIN_LIMIT = float(os.getenv("ADAPTIVE_MIN_LIMIT", "1"))
+ADAPTIVE_MAX_LIMIT = float(os.getenv("ADAPTIVE_MAX_LIMIT", "32"))
+# Multiplicative cut on overload
+ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", "0.5"))
+# A latency spike needs recent latency above both FACTOR x baseline and baseline + MIN_SPIKE_MS
+ADAPTIVE_LATENCY_FACTOR = float(os.getenv("ADAPTIVE_LATENCY_FACTOR", "2.5"))
+ADAPTIVE_MIN_SPIKE_MS = float(os.getenv("ADAPTIVE_MIN_SPIKE_MS", "500"))
+ADAPTIVE_MIN_SAMPLES = int(os.getenv("ADAPTIVE_MIN_SAMPLES", "10"))
+# Calls in the short window whose median is compared to the baseline
+ADAPTIVE_RECENT_WINDOW = int(os.getenv("ADAPTIVE_RECENT_WINDOW", "5"))
+
+# Throttling statuses; other errors are left to the circuit breaker
+OVERLOAD_STATUSES = {429, 503}
+
+
+def is_overload(exc: BaseException) -> bool:
+	"""True for throttling responses and timeouts from any of the HTTP/LLM clients."""
+	if isinstance(exc, BudgetExhausted):
+		return False  # the caller's deadline, not the upstream
+	if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+		return True
+	# httpx, requests, openai and ddgs all name their timeout/rate-limit errors this way
+	name = type(exc).__name__.lower()
+	if "timeout" in name or "ratelimit" in name:
+		return True
+	response = getattr(exc, "response", None)
+	status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+	return status in OVERLOAD_STATUSES
+
+
+class AIMDLimit:
+	"""Additive-increase / multiplicative-decrease concurrency limit for one upstream.
+
+	Each healthy call raises the limit by 1/limit (about +1 per round of
+	``limit`` calls) while the limit is actually in use. A 429/503, a timeout or
+	a latency spike cuts it by ``backoff``. A spike is the median of the last
+	few calls exceeding the long-run baseline by ``latency_factor`` and by
+	ADAPTIVE_MIN_SPIKE_MS, so single slow calls from a heavy-tailed upstream
+	(LLM, web search) do not count. Signals from calls started before the last
+	cut are ignored, so one overload episode costs a single cut. Thread-safe,
+	so the same limit can gate event-loop calls and worker threads.
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		initial: float = ADAPTIVE_INITIAL_LIMIT,
+		min_limit: float = ADAPTIVE_MIN_LIMIT,
+		max_limit: float = ADAPTIVE_MAX_LIMIT,
+		backoff: float = ADAPTIVE_BACKOFF,
+		latency_factor: float = ADAPTIVE_LATENCY_FACTOR,
+	) -> None:
+		self.name = name
+		self.min_limit = min_limit
+		self.max_limit = max(max_limit, min_limit)
+		self._limit = min(max(initial, min_limit), self.max_limit)
+		self.backoff = backoff
+		self.latency_factor = latency_factor
+		self.in_flight = 0
+		self.baseline: Optional[float] = None  # EWMA of call latency, seconds
+		self.recent: Deque[float] = deque(maxlen=ADAPTIVE_RECENT_WINDOW)
+		self._warmup: List[float] = []
+		self.samples = 0
+		self.decreases = 0
+		self._last_decrease = 0.0
+		self._lock = threading.Lock()
+
+	@property
+	def limit(self) -> int:
+		return max(int(self._limit), 1)
+
+	def _decrease(self, started: float, reason: str) -> None:
+		if started < self._last_decrease:
+			return  # already backed off for this episode
+		self._limit = max(self._limit * self.backoff, self.min_limit)
+		self._last_decrease = time.monotonic()
+		self.decreases += 1
+		print(f"[adaptive] {self.name} limit -> {self.limit} ({reason})")
+
+	def on_success(self, latency: float, started: float) -> None:
+		with self._lock:
+			self.recent.append(latency)
+			recent = statistics.median(self.recent)
+			spike = (
+				self.baseline is not None
+				and self.samples >= ADAPTIVE_MIN_SAMPLES
+				and len(self.recent) == self.recent.maxlen
+				and recent > self.baseline * self.latency_factor
+				and (recent - self.baseline) * 1000 > ADAPTIVE_MIN_SPIKE_MS
+			)
+			baseline = self.baseline
+			if self.samples < ADAPTIVE_MIN_SAMPLES:
+				# Seed from a median so one cold-connection call does not inflate the baseline
+				self._warmup.append(latency)
+				self.baseline = statistics.median(self._warmup)
+			else:
+				self._warmup = []
+				self.baseline = 0.95 * self.baseline + 0.05 * latency
+			self.samples += 1
+			if spike:
+				self.recent.clear()  # the next verdict needs a fresh window
+				self._decrease(started, f"recent latency {recent:.2f}s vs baseline {baseline:.2f}s")
+			elif self.in_flight + 1 >= self._limit / 2:
+				# Only grow a limit that is being used, or it inflates without evidence
+				self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+
+	def on_overload(self, started: float, exc: BaseException) -> None:
+		with self._lock:
+			self._decrease(started, type(exc).__name__)
+
+	@contextmanager
+	def measure(self) -> Iterator[None]:
+		"""Time the enclosed call and feed its outcome back into the limit."""
+		started = time.monotonic()
+		with self._lock:
+			self.in_flight += 1
+		try:
+			yield
+		except Exception as exc:
+			with self._lock:
+				self.in_flight -= 1
+			if is_overload(exc):
+				self.on_overload(started, exc)
+			raise
+		except BaseException:
+			with self._lock:
+				self.in_flight -= 1
+			raise
+		else:
+			with self._lock:
+				self.in_flight -= 1
+			self.on_success(time.monotonic() - started, started)
+
+	def snapshot(self) -> Dict[str, object]:
+		return {
+			"limit": self.limit,
+			"in_flight": self.in_flight,
+			"baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+			"decreases": self.decreases,
+		}
+
+
+class BlockingLimiter:
+	"""Thread-pool counterpart of the async schedulers, gated by an AIMDLimit."""
+
+	def __init__(self, limit: AIMDLimit) -> None:
+		self.limit = limit
+		self.in_use = 0
+		self._cond = threading.Condition()
+
+	@contextmanager
+	def slot(self) -> Iterator[None]:
+		with self._cond:
+			self._cond.wait_for(lambda: self.in_use < self.limit.limit)
+			self.in_use += 1
+		try:
+			with self.limit.measure():
+				yield
+		finally:
+			with self._cond:
+				self.in_use -= 1
+				# The limit may have grown as well, so wake every waiter
+				self._cond.notify_all()
+
+
+_limits: Dict[str, AIMDLimit] = {}
+_blocking: Dict[str, BlockingLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_limit(source: str, max_limit: float = ADAPTIVE_MAX_LIMIT) -> AIMDLimit:
+	with _registry_lock:
+		limit = _limits.get(source)
+		if limit is None:
+			limit = _limits[source] = AIMDLimit(source, max_limit=max_limit)
+		return limit
+
+
+def get_blocking_limiter(source: str, max_limit: float = ADAPTIVE_MAX_LIMIT) -> BlockingLimiter:
+	limit = get_limit(source, max_limit)
+	with _registry_lock:
+		limiter = _blocking.get(source)
+		if limiter is None:
+			limiter = _blocking[source] = BlockingLimiter(limit)
+		return limiter
+
+
+def limit_states() -> Dict[str, Dict[str, object]]:
+	return {name: limit.snapshot() for name, limit in _limits.items()}
@@ -1,9 +1,15 @@
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Dict, List, Optional
 
 import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from .matcher import get_matcher
+from .prompt_context import PROMPT_TOKEN_BUDGET, compact_context, rank_snippets, truncate_to_tokens
+from .latency import DEFAULT_BUDGET_MS, BudgetExhausted, budget_timeout, hedged, latency_budget, stop_on_budget, within_budget
+from .resilience import blocking_upstream_call, retry_unless_circuit_open, upstream_call
+from .source_cache import source_cache
+
 try:
 	from langgraph.graph import START, END, StateGraph
 	has_langgraph = True
@@ -11,29 +17,64 @@ except Exception:  # noqa: BLE001
 	has_langgraph = False
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+NPI_API_URL = os.getenv("NPI_API_URL", "https://npiregistry.cms.hhs.gov/api/")
+PUBMED_ESEARCH_URL = os.getenv("PUBMED_ESEARCH_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi")
+
+# Fields a profile must have before the adaptive tier will skip the LLM
+KEY_PROFILE_FIELDS = ("fullName", "specialty", "location")
+
+
+_openai_client: Optional[Any] = None
+
+
+def _get_openai_client() -> Any:
+	"""One AsyncOpenAI client (and connection pool) per process."""
+	global _openai_client
+	if _openai_client is None:
+		from openai import AsyncOpenAI
+
+		# Use standard OpenAI. No client-side retries: each would get the full clipped
+		# timeout again, and the circuit breaker and latency budget already bound failures
+		_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+	return _openai_client
 
 
 class AgentTools:
 	"""A set of stateless tools used by agents."""
 
 	def __init__(self, timeout: int = 30) -> None:
+		self.timeout = timeout
 		self.http = httpx.AsyncClient(timeout=timeout)
 
-	@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
+	async def aclose(self) -> None:
+		await self.http.aclose()
+
+	@retry(stop=stop_after_attempt(3) | stop_on_budget, wait=wait_exponential(min=1, max=8), retry=retry_unless_circuit_open)
 	async def npi_lookup(self, npi: str) -> Dict[str, Any]:
 		params = {"number": npi, "enumeration_type": "NPI-1", "version": 2.1}
-		r = await self.http.get("https://npiregistry.cms.hhs.gov/api/", params=params)
-		r.raise_for_status()
-		return r.json()
+		return await source_cache.get_or_fetch("npi_registry", npi, lambda: self._get_json("npi_registry", NPI_API_URL, params))
 
-	@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
+	@retry(stop=stop_after_attempt(3) | stop_on_budget, wait=wait_exponential(min=1, max=8), retry=retry_unless_circuit_open)
 	async def pubmed_search(self, full_name: str) -> Dict[str, Any]:
 		params = {"db": "pubmed", "term": full_name, "retmode": "json"}
-		r = await self.http.get("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi", params=params)
-		r.raise_for_status()
+		return await source_cache.get_or_fetch("pubmed", full_name, lambda: self._get_json("pubmed", PUBMED_ESEARCH_URL, params))
+
+	async def _get_json(self, source: str, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+		async with upstream_call(source):
+			with budget_timeout(self.timeout) as timeout:
+				r = await self.http.get(url, params=params, timeout=timeout)
+			r.raise_for_status()
 		return r.json()
 
 	async def web_search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+		# Search latency has a long tail, so slow calls are hedged with a duplicate
+		return await hedged("web", lambda: self._guarded_web_search(query, max_results))
+
+	async def _guarded_web_search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+		# DDGS is blocking; a hedged or budget-cancelled attempt keeps its slot until the thread returns
+		return await blocking_upstream_call("web", self._web_search_sync, query, max_results)
+
+	def _web_search_sync(self, query: str, max_results: int) -> List[Dict[str, str]]:
 		try:
 			from ddgs import DDGS  # Try new package name first
 		except ImportError:
@@ -54,21 +95,20 @@ class AgentTools:
 			return self._basic_profile_extraction(npi, npi_data, pubmed_data, web_data)
 		
 		try:
-			from openai import AsyncOpenAI
-			
-			# Use standard OpenAI
-			client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+			client = _get_openai_client()
 			model = "gpt-3.5-turbo"
 			
 			# Prepare context from all data sources
 			context = self._build_analysis_context(npi, npi_data, pubmed_data, web_data)
 			
-			response = await client.chat.completions.create(
-				model=model,
-				messages=[
-					{
-						"role": "system",
-						"content": """You are a healthcare professional profiler. Analyze the provided data and extract comprehensive information about the healthcare provider. Return a JSON object with the following structure:
+			async with upstream_call("llm"):
+				with budget_timeout(30) as timeout:  # 30 seconds, clipped to the latency budget
+					response = await client.chat.completions.create(
+						model=model,
+						messages=[
+							{
+								"role": "system",
+								"content": """You are a healthcare professional profiler. Analyze the provided data and extract comprehensive information about the healthcare provider. Return a JSON object with the following structure:
 
 {
   "fullName": "Full name of the provider",
@@ -93,17 +133,17 @@ class AgentTools:
 }
 
 Extract as much information as possible from the provided data. If information is not available, use empty strings or 0 values. Be realistic about confidence scores based on available data."""
-					},
-					{
-						"role": "user", 
-						"content": f"Analyze this healthcare provider data and extract structured information:\n\n{context}"
-					}
-				],
-				max_tokens=800,  # Reduced for faster response
-				temperature=0.1,
-				response_format={"type": "json_object"},
-				timeout=30  # 30 second timeout
-			)
+							},
+							{
+								"role": "user", 
+								"content": f"Analyze this healthcare provider data and extract structured information:\n\n{context}"
+							}
+						],
+						max_tokens=800,  # Reduced for faster response
+						temperature=0.1,
+						response_format={"type": "json_object"},
+						timeout=timeout
+					)
 			
 			import json
 			structured_data = json.loads(response.choices[0].message.content)
@@ -122,16 +162,21 @@ Extract as much information as possible from the provided data. If information i
 			print("Falling back to basic extraction...")
 			
 			# Fallback to basic extraction
-			return self._basic_profile_extraction(npi, npi_data, pubmed_data, web_data)
+			profile = self._basic_profile_extraction(npi, npi_data, pubmed_data, web_data)
+			profile["skippedSources"] = ["llm"]
+			return profile
 
 	def _build_analysis_context(self, npi: str, npi_data: Dict[str, Any], pubmed_data: Dict[str, Any], web_data: List[Dict[str, str]]) -> str:
 		"""Build comprehensive context for OpenAI analysis."""
 		context_parts = [f"NPI ID: {npi}"]
+		# Words used to rank web snippets by relevance
+		terms: List[str] = []
 		
 		# NPI Registry data
 		if npi_data.get("results"):
 			result = npi_data["results"][0]
 			basic = result.get("basic", {})
+			terms += [basic.get("first_name", ""), basic.get("last_name", "")]
 			context_parts.append(f"NPI Registry Data:")
 			context_parts.append(f"- Name: {basic.get('first_name', '')} {basic.get('last_name', '')}")
 			context_parts.append(f"- Gender: {basic.get('gender', '')}")
@@ -141,6 +186,7 @@ Extract as much information as possible from the provided data. If information i
 			addresses = result.get("addresses", [])
 			if addresses:
 				addr = addresses[0]
+				terms += [addr.get("city", ""), addr.get("organization_name", "")]
 				context_parts.append(f"- Location: {addr.get('city', '')}, {addr.get('state', '')}")
 				context_parts.append(f"- Organization: {addr.get('organization_name', '')}")
 				context_parts.append(f"- Phone: {addr.get('telephone_number', '')}")
@@ -148,23 +194,30 @@ Extract as much information as possible from the provided data. If information i
 			# Taxonomies (specialties)
 			taxonomies = result.get("taxonomies", [])
 			if taxonomies:
+				terms += [t.get("desc", "") for t in taxonomies]
 				context_parts.append(f"- Specialties: {', '.join([t.get('desc', '') for t in taxonomies])}")
 		
 		# PubMed data
+		optional_parts: List[str] = []
 		if pubmed_data.get("esearchresult", {}).get("count", "0") != "0":
 			context_parts.append(f"PubMed Publications: {pubmed_data['esearchresult']['count']} papers found")
-			if pubmed_data["esearchresult"].get("idlist"):
-				context_parts.append(f"Publication IDs: {', '.join(pubmed_data['esearchresult']['idlist'])}")
 		
-		# Web search data
+		# Web search data, most relevant first
 		if web_data:
 			context_parts.append(f"Web Search Results ({len(web_data)} found):")
-			for i, result in enumerate(web_data[:3]):  # Top 3 results
-				context_parts.append(f"- {i+1}. {result.get('title', '')}")
-				context_parts.append(f"  URL: {result.get('href', '')}")
-				context_parts.append(f"  Summary: {result.get('body', '')[:200]}...")
+			for i, result in enumerate(rank_snippets(web_data, terms)[:5]):
+				optional_parts.append("\n".join([
+					f"- {i+1}. {truncate_to_tokens(result.get('title', ''), 30)}",
+					f"  URL: {result.get('href', '')}",
+					f"  Summary: {truncate_to_tokens(result.get('body', ''), 60)}",
+				]))
+		
+		# Raw PubMed IDs carry the least signal, so they are cut first
+		idlist = pubmed_data.get("esearchresult", {}).get("idlist") or []
+		if idlist:
+			optional_parts.append(f"Publication IDs: {', '.join(idlist)}")
 		
-		return "\n".join(context_parts)
+		return compact_context(context_parts, optional_parts, PROMPT_TOKEN_BUDGET)
 
 	def _basic_profile_extraction(self, npi: str, npi_data: Dict[str, Any], pubmed_data: Dict[str, Any], web_data: List[Dict[str, str]]) -> Dict[str, Any]:
 		"""Basic extraction without OpenAI."""
@@ -205,28 +258,21 @@ Extract as much information as possible from the provided data. If information i
 		interests = []
 		recent_activity = ""
 		
-		for result in web_data:
-			title = result.get("title", "").lower()
-			body = result.get("body", "").lower()
-			href = result.get("href", "").lower()
-			
+		matcher = get_matcher()
+		for result, scan in zip(web_data, matcher.scan_results(web_data)):
 			# Extract social media profiles
-			if "linkedin" in href or "linkedin" in title:
-				social_media["linkedin"] = result.get("href", "")
-			elif "twitter" in href or "twitter" in title or "x.com" in href:
-				social_media["twitter"] = result.get("href", "")
+			if scan["social"]:
+				social_media[scan["social"]] = result.get("href", "")
 			
 			# Extract potential interests from web content
-			content = f"{title} {body}"
-			if any(word in content for word in ["research", "clinical", "education", "surgery", "cardiology", "oncology", "pediatrics"]):
-				interests.extend([word for word in ["research", "clinical", "education", "surgery", "cardiology", "oncology", "pediatrics"] if word in content])
+			interests.extend(matcher.interests(scan["hits"]))
 			
 			# Extract recent activity
-			if any(word in content for word in ["recent", "latest", "new", "announced", "published"]):
+			if scan["hits"].get("activity"):
 				recent_activity = result.get("title", "")[:100] + "..."
 		
 		# Remove duplicates and limit interests
-		interests = list(set(interests))[:5]
+		interests = list(dict.fromkeys(interests))[:5]
 		
 		# Determine engagement style based on data
 		engagement_style = ""
@@ -239,7 +285,7 @@ Extract as much information as possible from the provided data. If information i
 		else:
 			engagement_style = "Healthcare provider"
 		
-		return {
+		profile = {
 			"npi": npi,
 			"fullName": full_name,
 			"specialty": specialty,
@@ -252,20 +298,19 @@ Extract as much information as possible from the provided data. If information i
 			"recentActivity": recent_activity,
 			"publications": publications,
 			"engagementStyle": engagement_style,
-			"confidence": 60 if full_name != f"NPI {npi}" else 20,
+			"confidence": 0,
 			"summary": f"{full_name} is a {specialty} based in {location}. Affiliation: {affiliation}.",
 			"pubmed": pubmed_data,
 			"web": web_data
 		}
+		profile["confidence"] = heuristic_confidence(profile)
+		return profile
 
 	async def synthesize_summary(self, profile: Dict[str, Any]) -> str:
 		# Try to use OpenAI for better summarization if available
 		if OPENAI_API_KEY:
 			try:
-				from openai import AsyncOpenAI
-				
-				# Use standard OpenAI
-				client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+				client = _get_openai_client()
 				model = "gpt-3.5-turbo"
 				
 				# Build context from available data
@@ -326,13 +371,84 @@ Extract as much information as possible from the provided data. If information i
 		return f"{name} is a {specialty} based in {loc}. Affiliation: {aff}."
 
 
-async def run_agents_orchestrator(npi: str) -> Dict[str, Any]:
-	"""Run a comprehensive multi-step pipeline with OpenAI-powered data extraction."""
-	tools = AgentTools()
+def heuristic_confidence(profile: Dict[str, Any]) -> int:
+	"""Score how complete a heuristically extracted profile is (0-100)."""
+	if not profile.get("fullName") or profile["fullName"] == f"NPI {profile.get('npi')}":
+		return 20
+	score = 30
+	score += 15 if profile.get("specialty") else 0
+	score += 10 if profile.get("location") else 0
+	score += 10 if profile.get("affiliation") else 0
+	score += 5 if profile.get("degrees") else 0
+	score += 15 if profile.get("publications") else 0
+	social = profile.get("socialMediaHandles") or {}
+	score += 10 if social.get("linkedin") or social.get("twitter") else 0
+	score += 5 if profile.get("topInterests") else 0
+	return min(score, 100)
 
-	# Enhanced sequential flow with comprehensive data extraction (LangGraph has state issues)
-	npi_data = await tools.npi_lookup(npi)
-	# Get NPI data first to get the provider's name
+
+def needs_llm(profile: Dict[str, Any], confidence_threshold: int) -> bool:
+	if profile.get("confidence", 0) < confidence_threshold:
+		return True
+	return any(not profile.get(field) for field in KEY_PROFILE_FIELDS)
+
+
+async def _fetch_or_skip(call: Awaitable[Any], source: str, default: Any, skipped: List[str], npi: str) -> Any:
+	try:
+		return await within_budget(call)
+	except Exception as e:  # noqa: BLE001
+		print(f"[{source}] skipped for NPI {npi}: {e}")
+		skipped.append(source)
+		return default
+
+
+async def _llm_profile(tools: AgentTools, npi: str, npi_data: Dict[str, Any], pubmed_data: Dict[str, Any], web_data: List[Dict[str, str]]) -> Dict[str, Any]:
+	"""LLM extraction bounded by the latency budget (slot wait included); basic extraction if it runs out."""
+	try:
+		return await within_budget(tools.extract_structured_profile(npi, npi_data, pubmed_data, web_data))
+	except BudgetExhausted:
+		print(f"[llm] skipped for NPI {npi}: latency budget exhausted")
+		profile = tools._basic_profile_extraction(npi, npi_data, pubmed_data, web_data)
+		profile["skippedSources"] = ["llm"]
+		return profile
+
+
+async def run_agents_orchestrator(npi: str, depth: str = "deep", confidence_threshold: int = 70, budget_ms: Optional[int] = None) -> Dict[str, Any]:
+	"""Run the multi-step pipeline up to the requested depth tier.
+
+	registry stops after the NPI lookup, standard adds PubMed and web search,
+	deep always runs LLM extraction and adaptive runs it only when the
+	heuristic profile falls below ``confidence_threshold`` or lacks key fields.
+	Every stage gets only what is left of ``budget_ms`` (PROFILE_BUDGET_MS by
+	default); sources that run out of budget are listed in skippedSources.
+	"""
+	with latency_budget(budget_ms or DEFAULT_BUDGET_MS):
+		return await _run_pipeline(npi, depth, confidence_threshold)
+
+
+_shared_tools: Optional[AgentTools] = None
+
+
+def get_agent_tools() -> AgentTools:
+	"""Tools are stateless, so every pipeline run shares one HTTP client."""
+	global _shared_tools
+	if _shared_tools is None:
+		_shared_tools = AgentTools()
+	return _shared_tools
+
+
+async def close_agent_clients() -> None:
+	global _shared_tools, _openai_client
+	if _shared_tools is not None:
+		await _shared_tools.aclose()
+		_shared_tools = None
+	if _openai_client is not None:
+		await _openai_client.close()
+		_openai_client = None
+
+
+def search_query(npi: str, npi_data: Dict[str, Any]) -> str:
+	"""Quoted name/specialty/location query used for PubMed and web search."""
 	result = (npi_data.get("results", [{}]) or [{}])[0]
 	basic = result.get("basic", {}) if isinstance(result, dict) else {}
 	name_parts = [basic.get("first_name"), basic.get("last_name")]
@@ -352,16 +468,38 @@ async def run_agents_orchestrator(npi: str) -> Dict[str, Any]:
 		state = addr.get("state", "")
 		location = f"{city} {state}".strip()
 	
-	# Create more specific search queries
 	specific_search = f'"{search_name}"'
 	if specialty:
 		specific_search += f' "{specialty}"'
 	if location:
 		specific_search += f' "{location}"'
+	return specific_search
+
+
+async def _run_pipeline(npi: str, depth: str, confidence_threshold: int) -> Dict[str, Any]:
+	tools = get_agent_tools()
+	# Sources that failed or had an open circuit; the profile is built from the rest
+	skipped: List[str] = []
+
+	# Enhanced sequential flow with comprehensive data extraction (LangGraph has state issues)
+	npi_data = await _fetch_or_skip(tools.npi_lookup(npi), "npi_registry", {}, skipped, npi)
+	if depth == "registry":
+		profile = tools._basic_profile_extraction(npi, npi_data, {}, [])
+		profile["depth"] = depth
+		profile["skippedSources"] = skipped
+		return profile
+
+	specific_search = search_query(npi, npi_data)
+	pubmed_data = await _fetch_or_skip(tools.pubmed_search(specific_search), "pubmed", {}, skipped, npi)
+	web_data = await _fetch_or_skip(tools.web_search(f'{specific_search} healthcare provider'), "web", [], skipped, npi)
 	
-	pubmed_data = await tools.pubmed_search(specific_search)
-	web_data = await tools.web_search(f'{specific_search} healthcare provider')
-	
-	# Use OpenAI to extract comprehensive structured profile
-	profile = await tools.extract_structured_profile(npi, npi_data, pubmed_data, web_data)
+	if depth == "deep":
+		# Use OpenAI to extract comprehensive structured profile
+		profile = await _llm_profile(tools, npi, npi_data, pubmed_data, web_data)
+	else:
+		profile = tools._basic_profile_extraction(npi, npi_data, pubmed_data, web_data)
+		if depth == "adaptive" and needs_llm(profile, confidence_threshold):
+			profile = await _llm_profile(tools, npi, npi_data, pubmed_data, web_data)
+	profile["depth"] = depth
+	profile["skippedSources"] = skipped + profile.get("skippedSources", [])
 	return profile
@@ -0,0 +1,135 @@
+import asyncio
+import gc
+import os
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from .adaptive import limit_states
+from .resilience import breaker_states
+from .profiling import loop_lag_monitor
+from .scheduler import scheduler_states
+from .source_cache import source_cache
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+DIAGNOSTICS_LOG_INTERVAL = float(os.getenv("DIAGNOSTICS_LOG_INTERVAL", "0"))
+TRACEMALLOC_FRAMES = int(os.getenv("HCP_TRACEMALLOC_FRAMES", "0"))
+
+# Long-lived objects whose count should stay flat in a healthy server
+TRACKED_TYPES = (
+	"httpx.AsyncClient",
+	"openai.AsyncOpenAI",
+	"ProfileAgent",
+	"AgentTools",
+	"sqlite3.Connection",
+)
+
+
+def start_tracemalloc() -> None:
+	"""Enable tracemalloc when HCP_TRACEMALLOC_FRAMES > 0 (it costs CPU and memory)."""
+	if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+		tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def top_allocations(limit: int = 10) -> List[Dict[str, Any]]:
+	if not tracemalloc.is_tracing():
+		return []
+	stats = tracemalloc.take_snapshot().statistics("lineno")
+	return [
+		{"location": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+		for stat in stats[:limit]
+	]
+
+
+def rss_bytes() -> int:
+	try:
+		with open("/proc/self/status", "r", encoding="ascii") as fh:
+			for line in fh:
+				if line.startswith("VmRSS:"):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	if resource is None:
+		return 0
+	# Peak, not current, RSS; ru_maxrss is KiB on Linux and bytes on macOS
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def fd_stats() -> Dict[str, Optional[int]]:
+	fd_dir = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+	try:
+		fds = os.listdir(fd_dir)
+	except OSError:
+		return {"open_fds": None, "sockets": None}
+	sockets = 0
+	for fd in fds:
+		try:
+			if os.readlink(os.path.join(fd_dir, fd)).startswith("socket:"):
+				sockets += 1
+		except OSError:
+			continue
+	return {"open_fds": len(fds), "sockets": sockets if fd_dir == "/proc/self/fd" else None}
+
+
+def live_objects() -> Dict[str, int]:
+	"""Count live instances of TRACKED_TYPES (walks the GC heap; admin use only)."""
+	counts = Counter()
+	for obj in gc.get_objects():
+		cls = type(obj)
+		name = cls.__name__
+		if name in TRACKED_TYPES:
+			counts[name] += 1
+			continue
+		# Some extension metatypes (e.g. Cython's, via pandas) have a non-str __module__
+		module = getattr(cls, "__module__", "")
+		if isinstance(module, str) and f"{module.split('.')[0]}.{name}" in TRACKED_TYPES:
+			counts[f"{module.split('.')[0]}.{name}"] += 1
+	return dict(counts)
+
+
+def loop_stats(limit: int = 10) -> Dict[str, Any]:
+	try:
+		tasks = asyncio.all_tasks()
+	except RuntimeError:  # no running loop
+		return {"tasks": 0, "by_coroutine": {}}
+	names = Counter(getattr(t.get_coro(), "__qualname__", repr(t.get_coro())) for t in tasks)
+	return {"tasks": len(tasks), "by_coroutine": dict(names.most_common(limit))}
+
+
+def snapshot(top: int = 10, include_objects: bool = True) -> Dict[str, Any]:
+	data: Dict[str, Any] = {
+		"pid": os.getpid(),
+		"rss_mb": round(rss_bytes() / (1024 * 1024), 1),
+		**fd_stats(),
+		"event_loop": loop_stats(),
+		"loop_lag": loop_lag_monitor.snapshot(),
+		"circuits": breaker_states(),
+		"schedulers": scheduler_states(),
+		"concurrency_limits": limit_states(),
+		"source_cache": source_cache.stats(),
+		"tracemalloc": tracemalloc.is_tracing(),
+		"top_allocations": top_allocations(top),
+	}
+	if include_objects:
+		data["live_objects"] = live_objects()
+	return data
+
+
+async def periodic_log(interval: float = DIAGNOSTICS_LOG_INTERVAL) -> None:
+	"""Print a one-line resource summary every ``interval`` seconds."""
+	while True:
+		await asyncio.sleep(interval)
+		fds = fd_stats()
+		tasks = loop_stats(limit=3)
+		limits = {name: state["limit"] for name, state in limit_states().items()}
+		print(
+			f"[diagnostics] rss={rss_bytes() / (1024 * 1024):.1f}MB fds={fds['open_fds']} "
+			f"sockets={fds['sockets']} tasks={tasks['tasks']} top_tasks={tasks['by_coroutine']} "
+			f"limits={limits}"
+		)
+		for alloc in top_allocations(3):
+			print(f"[diagnostics]   {alloc['size_kb']}KB in {alloc['count']} blocks at {alloc['location']}")
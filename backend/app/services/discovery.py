@@ -0,0 +1,126 @@
+import asyncio
+import os
+import string
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+import httpx
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+from .resilience import retry_unless_circuit_open, upstream_call
+
+NPI_API_URL = os.getenv("NPI_API_URL", "https://npiregistry.cms.hhs.gov/api/")
+
+# Registry paging limits: at most 200 results per call and skip <= 1000,
+# so a single query can reach 1200 records at most
+PAGE_LIMIT = 200
+MAX_SKIP = 1000
+QUERY_CAP = MAX_SKIP + PAGE_LIMIT
+
+SEARCH_FIELDS = ("state", "city", "postal_code", "taxonomy_description", "first_name", "last_name")
+
+
+class RegistryQueryError(ValueError):
+	"""The NPI Registry rejected the query itself; retrying cannot help."""
+
+
+class NPIDiscovery:
+	"""Enumerate individual NPIs from the NPI Registry for a search filter.
+
+	Pages of a query are fetched concurrently. When a query hits the
+	registry's 1200-result cap it is split on last-name (or first-name)
+	prefix, since the registry accepts trailing wildcards of two or more
+	characters, until every part fits. Names starting with a non-letter
+	after the prefix are not reached by the split.
+	"""
+
+	def __init__(self, concurrency: int = 8, timeout: int = 30) -> None:
+		self.http = httpx.AsyncClient(timeout=timeout)
+		self.slots = asyncio.Semaphore(concurrency)
+
+	async def aclose(self) -> None:
+		await self.http.aclose()
+
+	@retry(
+		stop=stop_after_attempt(3),
+		wait=wait_exponential(min=1, max=8),
+		retry=retry_unless_circuit_open & retry_if_not_exception_type(RegistryQueryError),
+		reraise=True,
+	)
+	async def fetch_page(self, filters: Dict[str, str], skip: int) -> List[Dict[str, Any]]:
+		params = {"version": "2.1", "enumeration_type": "NPI-1", "limit": PAGE_LIMIT, "skip": skip, **filters}
+		async with self.slots:
+			async with upstream_call("npi_registry"):
+				r = await self.http.get(NPI_API_URL, params=params)
+				r.raise_for_status()
+		data = r.json()
+		if data.get("Errors"):
+			raise RegistryQueryError(f"NPI Registry rejected query {filters}: {data['Errors']}")
+		return data.get("results", []) or []
+
+	async def _query(self, filters: Dict[str, str]) -> List[Dict[str, Any]]:
+		"""Fetch every page of one query; the first page decides whether more exist."""
+		first = await self.fetch_page(filters, 0)
+		if len(first) < PAGE_LIMIT:
+			return first
+		rest = await asyncio.gather(*[
+			self.fetch_page(filters, skip) for skip in range(PAGE_LIMIT, MAX_SKIP + 1, PAGE_LIMIT)
+		])
+		results = list(first)
+		for page in rest:
+			results.extend(page)
+			if len(page) < PAGE_LIMIT:
+				break
+		return results
+
+	@staticmethod
+	def _split(filters: Dict[str, str]) -> List[Dict[str, str]]:
+		"""Partition a capped query by name prefix; [] when it cannot be narrowed."""
+		for field in ("last_name", "first_name"):
+			value = filters.get(field, "")
+			if value and not value.endswith("*"):
+				continue  # exact name, try the other field
+			prefix = value.rstrip("*").upper()
+			letters = string.ascii_uppercase
+			if len(prefix) < 2:
+				# Wildcards need at least two characters, so the first split is two letters deep
+				stems = [prefix + a + b for a in letters for b in letters] if not prefix else [prefix + a for a in letters]
+				parts = []
+			else:
+				stems = [prefix + a for a in letters]
+				# The prefix itself as an exact name is not covered by the longer wildcards
+				parts = [{**filters, field: prefix}]
+			return parts + [{**filters, field: f"{stem}*"} for stem in stems]
+		return []
+
+	async def iter_npis(self, filters: Dict[str, str], max_results: Optional[int] = None) -> AsyncIterator[str]:
+		"""Yield unique NPIs matching ``filters`` as soon as each query part completes."""
+		filters = {k: str(v) for k, v in filters.items() if k in SEARCH_FIELDS and v}
+		if not filters:
+			raise ValueError(f"At least one of {', '.join(SEARCH_FIELDS)} is required")
+		seen: Set[str] = set()
+		pending = [filters]
+		while pending:
+			batch, pending = pending[:16], pending[16:]
+			for part, results in zip(batch, await asyncio.gather(*[self._query(f) for f in batch])):
+				if len(results) >= QUERY_CAP:
+					# Truncated by the registry: split further instead of trusting this page set
+					parts = self._split(part)
+					if parts:
+						pending.extend(parts)
+						continue
+					print(f"[discovery] {part} exceeds {QUERY_CAP} results and cannot be split; results truncated")
+				for res in results:
+					npi = str(res.get("number", ""))
+					if npi and npi not in seen:
+						seen.add(npi)
+						yield npi
+						if max_results and len(seen) >= max_results:
+							return
+
+
+async def discover_npis(filters: Dict[str, str], max_results: Optional[int] = None, concurrency: int = 8) -> List[str]:
+	discovery = NPIDiscovery(concurrency=concurrency)
+	try:
+		return [npi async for npi in discovery.iter_npis(filters, max_results)]
+	finally:
+		await discovery.aclose()
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import pandas as pd
+
+# Uploads up to this size are parsed on the event loop; larger ones go to the process pool
+INLINE_MAX_BYTES = int(os.getenv("INGEST_INLINE_MAX_BYTES", str(256 * 1024)))
+MAX_PARALLEL_PARSES = int(os.getenv("INGEST_MAX_PARALLEL_PARSES", str(os.cpu_count() or 2)))
+
+NPI_COLUMNS = ("npi", "npi_id")
+
+
+class UnsupportedFileType(ValueError):
+	pass
+
+
+class MissingNPIColumn(ValueError):
+	pass
+
+
+def _default_excel_engine() -> Optional[str]:
+	engine = os.getenv("INGEST_EXCEL_ENGINE")
+	if engine:
+		return engine
+	try:
+		import python_calamine  # noqa: F401  Rust-backed reader, much faster than openpyxl
+		return "calamine"
+	except ImportError:
+		return None
+
+
+EXCEL_ENGINE = _default_excel_engine()
+
+
+def _is_npi_column(name: object) -> bool:
+	return str(name).lower() in NPI_COLUMNS
+
+
+def read_npi_values(filename: str, contents: bytes, excel_engine: Optional[str] = EXCEL_ENGINE) -> List[str]:
+	"""Parse an upload and return the raw values of its NPI column.
+
+	Only the NPI column is materialised. Runs in a worker process for large
+	files, so it takes and returns plain picklable values.
+	"""
+	if filename.endswith((".xlsx", ".xls")):
+		df = pd.read_excel(io.BytesIO(contents), dtype=str, usecols=_is_npi_column, engine=excel_engine)
+	elif filename.endswith(".csv"):
+		df = pd.read_csv(io.BytesIO(contents), dtype=str, usecols=_is_npi_column)
+	else:
+		raise UnsupportedFileType("Unsupported file type")
+
+	lowered = {str(c).lower(): c for c in df.columns}
+	npi_column = lowered.get("npi") or lowered.get("npi_id")
+	if npi_column is None:
+		raise MissingNPIColumn("Missing required column 'npi' or 'npi_id'")
+	return df[npi_column].dropna().astype(str).tolist()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_parse_slots = asyncio.Semaphore(MAX_PARALLEL_PARSES)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+	global _pool
+	if _pool is None:
+		# The server is threaded (executor, sampler and client threads), so forking it could copy held locks
+		method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+		_pool = ProcessPoolExecutor(max_workers=MAX_PARALLEL_PARSES, mp_context=multiprocessing.get_context(method))
+	return _pool
+
+
+async def parse_upload(filename: str, contents: bytes) -> List[str]:
+	"""Parse small uploads inline and offload large ones to the process pool."""
+	if not filename.endswith((".xlsx", ".xls", ".csv")):
+		raise UnsupportedFileType("Unsupported file type")
+	if len(contents) <= INLINE_MAX_BYTES:
+		return read_npi_values(filename, contents)
+	async with _parse_slots:
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(_get_pool(), read_npi_values, filename, contents)
+
+
+def shutdown_parse_pool() -> None:
+	global _pool
+	if _pool is not None:
+		_pool.shutdown(wait=False, cancel_futures=True)
+		_pool = None
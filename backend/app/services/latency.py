@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional
+
+import httpx
+from tenacity import RetryCallState
+
+# Per-profile end-to-end budget; 0 disables the deadline
+DEFAULT_BUDGET_MS = int(os.getenv("PROFILE_BUDGET_MS", "0"))
+# Duplicate a slow call once it has run longer than this percentile of recent latencies
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+_deadline: ContextVar[Optional[float]] = ContextVar("profile_deadline", default=None)
+
+
+class BudgetExhausted(asyncio.TimeoutError):
+	pass
+
+
+@contextmanager
+def latency_budget(budget_ms: Optional[int]) -> Iterator[None]:
+	"""Set the deadline for everything awaited inside the block.
+
+	Nested budgets can only tighten an outer deadline, never extend it.
+	"""
+	if not budget_ms:
+		yield
+		return
+	deadline = time.monotonic() + budget_ms / 1000
+	outer = _deadline.get()
+	if outer is not None:
+		deadline = min(deadline, outer)
+	token = _deadline.set(deadline)
+	try:
+		yield
+	finally:
+		_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+	"""Seconds left in the current budget, or None when unbounded."""
+	deadline = _deadline.get()
+	if deadline is None:
+		return None
+	return max(deadline - time.monotonic(), 0.0)
+
+
+def call_timeout(cap: float) -> float:
+	"""Timeout for a single call: ``cap`` clipped to the remaining budget."""
+	left = remaining()
+	if left is None:
+		return cap
+	if left <= 0:
+		raise BudgetExhausted("latency budget exhausted")
+	return min(cap, left)
+
+
+def _is_timeout(exc: BaseException) -> bool:
+	# openai's APITimeoutError does not derive from the httpx or builtin timeouts
+	return isinstance(exc, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException)) or "timeout" in type(exc).__name__.lower()
+
+
+@contextmanager
+def budget_timeout(cap: float) -> Iterator[float]:
+	"""Yield the timeout for one call, made inside the block.
+
+	When the budget clipped it below ``cap`` and it fires, BudgetExhausted is
+	raised instead of the client's timeout: the caller ran out of time, the
+	upstream was not slow, so breakers and concurrency limits must not react.
+	"""
+	timeout = call_timeout(cap)
+	try:
+		yield timeout
+	except BudgetExhausted:
+		raise
+	except Exception as exc:
+		if timeout < cap and _is_timeout(exc):
+			raise BudgetExhausted("latency budget exhausted") from exc
+		raise
+
+
+def stop_on_budget(retry_state: RetryCallState) -> bool:
+	"""tenacity stop condition: give up when the next backoff would overrun the budget."""
+	left = remaining()
+	if left is None:
+		return False
+	return left <= (retry_state.upcoming_sleep or 0)
+
+
+async def within_budget(call: Awaitable[Any]) -> Any:
+	"""Await ``call`` but abandon it when the current budget runs out."""
+	left = remaining()
+	if left is None:
+		return await call
+	if left <= 0:
+		if asyncio.iscoroutine(call):
+			call.close()
+		raise BudgetExhausted("latency budget exhausted")
+	try:
+		return await asyncio.wait_for(call, timeout=left)
+	except asyncio.TimeoutError as exc:
+		raise BudgetExhausted("latency budget exhausted") from exc
+
+
+class LatencyTracker:
+	"""Rolling window of successful call latencies for one source."""
+
+	def __init__(self, window: int = 200) -> None:
+		self.samples: Deque[float] = deque(maxlen=window)
+
+	def record(self, seconds: float) -> None:
+		self.samples.append(seconds)
+
+	def percentile(self, pct: float) -> Optional[float]:
+		if len(self.samples) < HEDGE_MIN_SAMPLES:
+			return None
+		ordered = sorted(self.samples)
+		index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+		return ordered[index]
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+
+
+def get_tracker(source: str) -> LatencyTracker:
+	tracker = _trackers.get(source)
+	if tracker is None:
+		tracker = _trackers[source] = LatencyTracker()
+	return tracker
+
+
+async def _timed(source: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+	start = time.monotonic()
+	result = await factory()
+	get_tracker(source).record(time.monotonic() - start)
+	return result
+
+
+async def hedged(source: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+	"""Run ``factory()``; if it outlives the source's hedge percentile, race a duplicate.
+
+	The first successful result wins and the other attempt is cancelled. Until
+	enough latency samples exist the call is not hedged.
+	"""
+	delay = get_tracker(source).percentile(HEDGE_PERCENTILE)
+	tasks = {asyncio.create_task(_timed(source, factory))}
+	try:
+		if delay is not None:
+			done, _ = await asyncio.wait(tasks, timeout=delay)
+			left = remaining()
+			if not done and (left is None or left > 0):
+				tasks.add(asyncio.create_task(_timed(source, factory)))
+
+		pending = set(tasks)
+		error: Optional[BaseException] = None
+		while pending:
+			done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+			for task in done:
+				if task.exception() is None:
+					return task.result()
+				error = task.exception()
+		assert error is not None
+		raise error
+	finally:
+		for task in tasks:
+			if not task.done():
+				task.cancel()
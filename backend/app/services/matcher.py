@@ -0,0 +1,104 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+# category -> label -> keywords. Labels of the "specialty" and "interest"
+# categories are reported as interests; "activity" marks recent-news results.
+# Keywords match at the start of a word, so "research" also matches "researchers".
+DEFAULT_TAXONOMY: Dict[str, Dict[str, List[str]]] = {
+	"specialty": {
+		"cardiology": ["cardiology", "cardiologist", "cardiac"],
+		"oncology": ["oncology", "oncologist", "cancer"],
+		"pediatrics": ["pediatrics", "pediatric", "pediatrician"],
+		"surgery": ["surgery", "surgeon", "surgical"],
+	},
+	"interest": {
+		"research": ["research", "researcher"],
+		"clinical": ["clinical"],
+		"education": ["education", "educator", "teaching"],
+	},
+	"activity": {
+		"recent": ["recent", "latest", "new", "announced", "published"],
+	},
+}
+
+TAXONOMY_PATH = os.getenv("HCP_TAXONOMY_PATH")
+
+# Social network per host; subdomains (www., uk.) count as the same network
+SOCIAL_HOSTS = {"linkedin.com": "linkedin", "twitter.com": "twitter", "x.com": "twitter"}
+_TWITTER_MENTION = re.compile(r"\b(?:twitter|x\.com)\b", re.IGNORECASE)
+# "@handle" on its own, not the domain part of an email address
+_HANDLE_PATTERN = re.compile(r"(?<![\w.@])@([A-Za-z0-9_]{1,29})\b")
+
+
+def social_network(href: str) -> Optional[str]:
+	"""The network whose host serves ``href`` ("linkedin", "twitter"), else None."""
+	host = (urlparse(href).hostname or "").lower()
+	for domain, network in SOCIAL_HOSTS.items():
+		if host == domain or host.endswith("." + domain):
+			return network
+	return None
+
+
+class KeywordMatcher:
+	"""Single compiled alternation over every taxonomy keyword."""
+
+	def __init__(self, taxonomy: Dict[str, Dict[str, List[str]]]) -> None:
+		self.taxonomy = taxonomy
+		self._lookup: Dict[str, tuple] = {}
+		for category, labels in taxonomy.items():
+			for label, keywords in labels.items():
+				for keyword in keywords:
+					self._lookup.setdefault(keyword.lower(), (category, label))
+		# Longest first so multi-word keywords win over their prefixes
+		alternation = "|".join(re.escape(k) for k in sorted(self._lookup, key=len, reverse=True))
+		self._pattern = re.compile(rf"\b({alternation})\w*", re.IGNORECASE) if alternation else None
+
+	def match(self, text: str) -> Dict[str, List[str]]:
+		"""Return matched labels per category, in first-seen order."""
+		hits: Dict[str, List[str]] = {}
+		if not text or self._pattern is None:
+			return hits
+		for m in self._pattern.finditer(text):
+			category, label = self._lookup[m.group(1).lower()]
+			labels = hits.setdefault(category, [])
+			if label not in labels:
+				labels.append(label)
+		return hits
+
+	def scan_results(self, results: List[Dict[str, str]]) -> List[Dict[str, object]]:
+		"""Classify a batch of web results in one pass over each title+body."""
+		scanned = []
+		for res in results:
+			title = res.get("title") or ""
+			body = res.get("body") or ""
+			href = res.get("href") or ""
+			text = f"{title} {body}"
+
+			handle = None
+			if _TWITTER_MENTION.search(text):
+				h = _HANDLE_PATTERN.search(text)
+				if h:
+					handle = f"@{h.group(1)}"
+
+			scanned.append({"hits": self.match(text), "social": social_network(href), "handle": handle})
+		return scanned
+
+	def interests(self, hits: Dict[str, List[str]]) -> List[str]:
+		return hits.get("specialty", []) + hits.get("interest", [])
+
+
+def load_taxonomy(path: Optional[str] = None) -> Dict[str, Dict[str, List[str]]]:
+	path = path or TAXONOMY_PATH
+	if not path:
+		return DEFAULT_TAXONOMY
+	with open(path, "r", encoding="utf-8") as fh:
+		return json.load(fh)
+
+
+@lru_cache(maxsize=1)
+def get_matcher() -> KeywordMatcher:
+	return KeywordMatcher(load_taxonomy())
@@ -0,0 +1,49 @@
+import asyncio
+import os
+from typing import List
+
+from .agents import get_agent_tools, search_query
+from .profile_agent import registry_full_name
+from .scheduler import priority_scope
+from .source_cache import source_cache
+
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+
+
+async def _prefetch_one(npi: str) -> None:
+	tools = get_agent_tools()
+	npi_data = await tools.npi_lookup(npi)
+	result = (npi_data.get("results", [{}]) or [{}])[0]
+	if not isinstance(result, dict) or not result.get("basic"):
+		return
+	# /profile searches PubMed by full name, /profile/agents by name + specialty + location
+	terms = {registry_full_name(npi, result["basic"]), search_query(npi, npi_data)}
+	await asyncio.gather(*[tools.pubmed_search(term) for term in terms])
+
+
+async def prefetch_sources(npi_list: List[str], concurrency: int = PREFETCH_CONCURRENCY) -> None:
+	"""Warm the source cache with NPI Registry and PubMed data for ``npi_list``.
+
+	Runs in the bulk priority class, so profiling requests that arrive while it
+	is still going take precedence for upstream slots. Failures are left for
+	the profiling call to retry. Only the first NPIs that fit in the cache are
+	prefetched; warming more would evict the start of the list.
+	"""
+	capacity = source_cache.npi_capacity()
+	if len(npi_list) > capacity:
+		print(f"[prefetch] {len(npi_list)} NPIs exceed SOURCE_CACHE_SIZE; prefetching the first {capacity}")
+		npi_list = npi_list[:capacity]
+	slots = asyncio.Semaphore(concurrency)
+	failed = 0
+
+	async def one(npi: str) -> None:
+		nonlocal failed
+		async with slots:
+			try:
+				await _prefetch_one(npi)
+			except Exception:  # noqa: BLE001
+				failed += 1
+
+	with priority_scope("bulk"):
+		await asyncio.gather(*[one(npi) for npi in npi_list])
+	print(f"[prefetch] warmed {len(npi_list) - failed}/{len(npi_list)} NPIs")
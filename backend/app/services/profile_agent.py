@@ -1,26 +1,52 @@
+import asyncio
 import os
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Optional
 
 import httpx
 from duckduckgo_search import DDGS
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from ..models import HCPProfile
+from .latency import DEFAULT_BUDGET_MS, budget_timeout, hedged, latency_budget, stop_on_budget, within_budget
+from .matcher import get_matcher
+from .resilience import blocking_upstream_call, retry_unless_circuit_open, upstream_call
+from .source_cache import source_cache
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# NPIs profiled at once per batch; upstream access is further shared by priority
+BATCH_CONCURRENCY = int(os.getenv("PROFILE_BATCH_CONCURRENCY", "8"))
+PUBMED_ESEARCH_URL = os.getenv("PUBMED_ESEARCH_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi")
+
+
+def registry_full_name(npi: str, basic: Dict[str, Any]) -> str:
+	name_parts = [
+		basic.get("name_prefix"),
+		basic.get("first_name"),
+		basic.get("middle_name"),
+		basic.get("last_name"),
+	]
+	return " ".join([p for p in name_parts if p]).strip() or f"NPI {npi}"
 
 
 class ProfileAgent:
-	NPI_ENDPOINT = "https://npiregistry.cms.hhs.gov/api/"
+	NPI_ENDPOINT = os.getenv("NPI_API_URL", "https://npiregistry.cms.hhs.gov/api/")
 
 	def __init__(self) -> None:
 		self.http = httpx.AsyncClient(timeout=30)
 
-	@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
+	async def aclose(self) -> None:
+		await self.http.aclose()
+
+	@retry(stop=stop_after_attempt(3) | stop_on_budget, wait=wait_exponential(min=1, max=8), retry=retry_unless_circuit_open)
 	async def fetch_npi(self, npi: str) -> Dict[str, Any]:
 		params = {"number": npi, "enumeration_type": "NPI-1", "version": 2.1}
-		r = await self.http.get(self.NPI_ENDPOINT, params=params)
-		r.raise_for_status()
+		return await source_cache.get_or_fetch("npi_registry", npi, lambda: self._get_json("npi_registry", self.NPI_ENDPOINT, params))
+
+	async def _get_json(self, source: str, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+		async with upstream_call(source):
+			with budget_timeout(30) as timeout:
+				r = await self.http.get(url, params=params, timeout=timeout)
+			r.raise_for_status()
 		return r.json()
 
 	def search_web(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
@@ -32,90 +58,106 @@ class ProfileAgent:
 					break
 		return results
 
-	@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
+	async def _guarded_web_search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+		return await blocking_upstream_call("web", self.search_web, query, max_results)
+
+	@retry(stop=stop_after_attempt(3) | stop_on_budget, wait=wait_exponential(min=1, max=8), retry=retry_unless_circuit_open)
 	async def fetch_pubmed_count(self, full_name: str) -> int:
 		if not full_name:
 			return 0
 		params = {"db": "pubmed", "term": full_name, "retmode": "json"}
-		r = await self.http.get("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi", params=params)
-		r.raise_for_status()
-		data = r.json()
+		data = await source_cache.get_or_fetch("pubmed", full_name, lambda: self._get_json("pubmed", PUBMED_ESEARCH_URL, params))
 		try:
 			return int(data.get("esearchresult", {}).get("count", 0))
 		except Exception:  # noqa: BLE001
 			return 0
 
-	async def generate_profiles(self, npi_list: List[str], max_results_per_source: int) -> List[HCPProfile]:
-		profiles: List[HCPProfile] = []
-		for npi in npi_list:
+	async def generate_profiles(self, npi_list: List[str], max_results_per_source: int, depth: str = "standard", budget_ms: Optional[int] = None) -> List[HCPProfile]:
+		# This pipeline has no LLM stage, so deep/adaptive behave like standard
+		batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+		async def one(npi: str) -> HCPProfile:
+			async with batch_slots:
+				with latency_budget(budget_ms or DEFAULT_BUDGET_MS):
+					return await self._generate_profile(npi, max_results_per_source, depth)
+
+		return list(await asyncio.gather(*[one(npi) for npi in npi_list]))
+
+	async def _generate_profile(self, npi: str, max_results_per_source: int, depth: str) -> HCPProfile:
+		matcher = get_matcher()
+		skipped: List[str] = []
+		try:
+			npi_data = await within_budget(self.fetch_npi(npi))
+		except Exception:
+			npi_data = {}
+			skipped.append("npi_registry")
+
+		result = (npi_data.get("results", [{}]) or [{}])[0]
+		basic = result.get("basic", {}) if isinstance(result, dict) else {}
+		taxonomies = result.get("taxonomies", []) if isinstance(result, dict) else []
+		practice_locations = result.get("addresses", []) if isinstance(result, dict) else []
+
+		full_name = registry_full_name(npi, basic)
+
+		specialty = ""
+		if taxonomies:
+			primary = next((t for t in taxonomies if t.get("primary") is True), taxonomies[0])
+			specialty = primary.get("desc", "") or primary.get("code", "")
+
+		location = ""
+		affiliation = ""
+		if practice_locations:
+			loc = next((a for a in practice_locations if a.get("address_purpose") == "LOCATION"), practice_locations[0])
+			city = loc.get("city", "")
+			state = loc.get("state", "")
+			location = ", ".join([s for s in [city, state] if s])
+			affiliation = loc.get("organization_name", "") or loc.get("address_1", "")
+
+		# safe optional practiceLocations
+		pl = result.get("practiceLocations")
+		if isinstance(pl, list) and pl:
+			candidate = pl[0] or {}
+			affiliation = affiliation or candidate.get("name", "") or candidate.get("organization_name", "")
+
+		degrees = basic.get("credential") or "MD"
+
+		pubs = 0
+		web_results: List[Dict[str, str]] = []
+		if depth != "registry":
+			try:
+				pubs = await within_budget(self.fetch_pubmed_count(full_name))
+			except Exception:
+				skipped.append("pubmed")
+			query = f"{full_name} {specialty} LinkedIn Twitter profile hospital"
 			try:
-				npi_data = await self.fetch_npi(npi)
+				# Same hedging as the agents pipeline; the slot wait counts against the budget too
+				web_results = await within_budget(hedged("web", lambda: self._guarded_web_search(query, max_results_per_source)))
 			except Exception:
-				npi_data = {}
-
-			result = (npi_data.get("results", [{}]) or [{}])[0]
-			basic = result.get("basic", {}) if isinstance(result, dict) else {}
-			taxonomies = result.get("taxonomies", []) if isinstance(result, dict) else []
-			practice_locations = result.get("addresses", []) if isinstance(result, dict) else []
-
-			name_parts = [
-				basic.get("name_prefix"),
-				basic.get("first_name"),
-				basic.get("middle_name"),
-				basic.get("last_name"),
-			]
-			full_name = " ".join([p for p in name_parts if p]).strip() or f"NPI {npi}"
-
-			specialty = ""
-			if taxonomies:
-				primary = next((t for t in taxonomies if t.get("primary") is True), taxonomies[0])
-				specialty = primary.get("desc", "") or primary.get("code", "")
-
-			location = ""
-			affiliation = ""
-			if practice_locations:
-				loc = next((a for a in practice_locations if a.get("address_purpose") == "LOCATION"), practice_locations[0])
-				city = loc.get("city", "")
-				state = loc.get("state", "")
-				location = ", ".join([s for s in [city, state] if s])
-				affiliation = loc.get("organization_name", "") or loc.get("address_1", "")
-
-			# safe optional practiceLocations
-			pl = result.get("practiceLocations")
-			if isinstance(pl, list) and pl:
-				candidate = pl[0] or {}
-				affiliation = affiliation or candidate.get("name", "") or candidate.get("organization_name", "")
-
-			degrees = basic.get("credential") or "MD"
-
-			pubs = await self.fetch_pubmed_count(full_name)
-			web_results = self.search_web(f"{full_name} {specialty} LinkedIn Twitter profile hospital", max_results=max_results_per_source)
-
-			linkedin_url = next((r["href"] for r in web_results if "linkedin.com" in r.get("href", "")), None)
-			twitter_handle = None
-			for r in web_results:
-				body = (r.get("body") or "") + " " + (r.get("title") or "")
-				if "@" in body and "twitter" in body.lower():
-					candidate = body.split("@")[1].split()[0].strip().strip(",.()")
-					if candidate and len(candidate) < 30:
-						twitter_handle = f"@{candidate}"
-						break
-
-			profile = HCPProfile(
-				id=npi,
-				fullName=full_name,
-				specialty=specialty or "",
-				affiliation=affiliation or "",
-				location=location or "",
-				degrees=degrees,
-				socialMediaHandles={"twitter": twitter_handle, "linkedin": linkedin_url},
-				followers={"twitter": None, "linkedin": None},
-				topInterests=[specialty] if specialty else [],
-				recentActivity="",
-				publications=max(pubs, 0),
-				engagementStyle="",
-				confidence=85,
-				summary=f"Publicly available details compiled for {full_name}.",
-			)
-			profiles.append(profile)
-		return profiles
+				skipped.append("web")
+
+		scans = matcher.scan_results(web_results)
+		linkedin_url = next((r["href"] for r, scan in zip(web_results, scans) if scan["social"] == "linkedin"), None)
+		twitter_handle = next((scan["handle"] for scan in scans if scan["handle"]), None)
+		interests = [specialty] if specialty else []
+		for scan in scans:
+			interests.extend(matcher.interests(scan["hits"]))
+		interests = list(dict.fromkeys(interests))[:5]
+
+		profile = HCPProfile(
+			id=npi,
+			fullName=full_name,
+			specialty=specialty or "",
+			affiliation=affiliation or "",
+			location=location or "",
+			degrees=degrees,
+			socialMediaHandles={"twitter": twitter_handle, "linkedin": linkedin_url},
+			followers={"twitter": None, "linkedin": None},
+			topInterests=interests,
+			recentActivity="",
+			publications=max(pubs, 0),
+			engagementStyle="",
+			confidence=85,
+			summary=f"Publicly available details compiled for {full_name}.",
+			skippedSources=skipped,
+		)
+		return profile
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from types import FrameType
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+# Off by default: any client could otherwise trigger profiling and fill PROFILE_DIR
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profiles kept on disk; the oldest are deleted past this
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# Profiled requests allowed at once; others run unprofiled
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+MAX_STACK_DEPTH = 64
+
+_active_session: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+_sessions_running = 0
+
+
+def _frame_label(frame: FrameType) -> str:
+	code = frame.f_code
+	return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_stack(frame: Optional[FrameType]) -> List[str]:
+	"""Root-to-leaf labels, starting at the coroutine the event loop is stepping."""
+	frames: List[FrameType] = []
+	while frame is not None and len(frames) < MAX_STACK_DEPTH:
+		frames.append(frame)
+		frame = frame.f_back
+	frames.reverse()
+	# Drop the loop machinery (run_forever -> _run_once -> Handle._run -> Task step)
+	for i in range(len(frames) - 1, -1, -1):
+		if frames[i].f_code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+			frames = frames[i + 1:]
+			break
+	return [_frame_label(f) for f in frames]
+
+
+def _await_stack(task: asyncio.Task) -> List[str]:
+	"""Root-to-leaf labels of the await chain a suspended task is parked on."""
+	labels: List[str] = []
+	coro: Any = task.get_coro()
+	while coro is not None and len(labels) < MAX_STACK_DEPTH:
+		frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+		if frame is None:
+			if isinstance(coro, asyncio.Future):
+				labels.append(f"[{type(coro).__name__}]")
+			break
+		labels.append(_frame_label(frame))
+		coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+	return labels
+
+
+def _task_name(task: Optional[asyncio.Task]) -> str:
+	if task is None:
+		return "[idle]"
+	coro = task.get_coro()
+	return getattr(coro, "__qualname__", task.get_name())
+
+
+class ProfileSession:
+	"""Sampling profile of one request.
+
+	A daemon thread samples the event-loop thread every ``interval`` seconds.
+	While one of the request's tasks is running, its stack counts as ``cpu``;
+	the await chains of its suspended tasks count as ``wait``; and any other
+	task holding the loop meanwhile is counted in ``loop_held_by``. Tasks are
+	attributed to the request by the task factory installed in ``start``.
+	Work inside ``asyncio.to_thread`` shows up as the awaiting frame.
+	"""
+
+	def __init__(self, label: str, interval: float = PROFILE_SAMPLE_INTERVAL_MS / 1000) -> None:
+		self.id = uuid.uuid4().hex[:12]
+		self.label = label
+		self.interval = interval
+		self.cpu: Counter = Counter()
+		self.wait: Counter = Counter()
+		self.loop_held_by: Counter = Counter()
+		self.samples = 0
+		self._tasks: set = set()
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._started = 0.0
+		self._token: Any = None
+		self.duration = 0.0
+
+	def track(self, task: asyncio.Task) -> None:
+		with self._lock:
+			self._tasks.add(task)
+		task.add_done_callback(self._untrack)
+
+	def _untrack(self, task: asyncio.Task) -> None:
+		with self._lock:
+			self._tasks.discard(task)
+
+	def start(self) -> None:
+		loop = asyncio.get_running_loop()
+		_install_task_factory(loop)
+		current = asyncio.current_task()
+		if current is not None:
+			self.track(current)
+		self._started = time.monotonic()
+		self._thread = threading.Thread(
+			target=self._sample_loop, args=(loop, threading.get_ident()), name=f"profile-{self.id}", daemon=True
+		)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self.duration = time.monotonic() - self._started
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+
+	def _sample_loop(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+		while not self._stop.wait(self.interval):
+			running = asyncio.current_task(loop)
+			with self._lock:
+				tasks = list(self._tasks)
+			if running is not None and running in tasks:
+				frame = sys._current_frames().get(loop_thread)
+				self.cpu[";".join(_thread_stack(frame))] += 1
+			elif running is not None:
+				self.loop_held_by[_task_name(running)] += 1
+			for task in tasks:
+				if task is running or task.done():
+					continue
+				try:
+					stack = _await_stack(task)
+				except Exception:  # noqa: BLE001 - task resumed mid-walk
+					continue
+				if stack:
+					self.wait[";".join(stack)] += 1
+			self.samples += 1
+
+	def to_dict(self, top: int = 15) -> Dict[str, Any]:
+		interval_ms = self.interval * 1000
+		return {
+			"id": self.id,
+			"request": self.label,
+			"duration_ms": round(self.duration * 1000, 1),
+			"interval_ms": interval_ms,
+			"samples": self.samples,
+			"cpu_ms": round(sum(self.cpu.values()) * interval_ms, 1),
+			"top_cpu": _top_frames(self.cpu, top, interval_ms),
+			"top_wait": _top_frames(self.wait, top, interval_ms),
+			"loop_held_by": {name: round(n * interval_ms, 1) for name, n in self.loop_held_by.most_common(top)},
+			# Collapsed "root;...;leaf count" lines, loadable in speedscope or flamegraph.pl
+			"collapsed": {"cpu": dict(self.cpu), "wait": dict(self.wait)},
+		}
+
+
+def _top_frames(stacks: Counter, top: int, interval_ms: float) -> List[Dict[str, Any]]:
+	"""Leaf frames ranked by sampled time (self time for cpu, parked time for wait)."""
+	leaves: Counter = Counter()
+	for stack, count in stacks.items():
+		leaves[stack.rsplit(";", 1)[-1]] += count
+	return [{"frame": frame, "ms": round(count * interval_ms, 1)} for frame, count in leaves.most_common(top)]
+
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop) -> None:
+	"""Attribute tasks created inside a profiled request to its session (once per loop)."""
+	previous = loop.get_task_factory()
+	if getattr(previous, "tracks_profiles", False):
+		return
+
+	def factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> asyncio.Task:
+		task = previous(loop, coro, **kwargs) if previous is not None else asyncio.Task(coro, loop=loop, **kwargs)
+		session = _active_session.get()
+		if session is not None:
+			session.track(task)
+		return task
+
+	factory.tracks_profiles = True  # type: ignore[attr-defined]
+	loop.set_task_factory(factory)
+
+
+def begin_profile(label: str) -> Optional[ProfileSession]:
+	"""Start profiling the calling request; None when disabled or at capacity."""
+	global _sessions_running
+	if not REQUEST_PROFILING or _sessions_running >= PROFILE_MAX_CONCURRENT:
+		return None
+	_sessions_running += 1
+	session = ProfileSession(label)
+	session._token = _active_session.set(session)
+	session.start()
+	return session
+
+
+async def end_profile(session: ProfileSession) -> str:
+	"""Stop ``session`` and write it to PROFILE_DIR; returns the profile id."""
+	global _sessions_running
+	session.stop()
+	_sessions_running -= 1
+	_active_session.reset(session._token)
+	await asyncio.to_thread(_write_profile, session.to_dict())
+	return session.id
+
+
+def _write_profile(data: Dict[str, Any]) -> None:
+	os.makedirs(PROFILE_DIR, exist_ok=True)
+	with open(os.path.join(PROFILE_DIR, f"{data['id']}.json"), "w", encoding="utf-8") as fh:
+		json.dump(data, fh)
+	_prune_profiles()
+
+
+def _prune_profiles() -> None:
+	"""Keep only the newest PROFILE_MAX_FILES profiles."""
+	with os.scandir(PROFILE_DIR) as entries:
+		profiles = [e for e in entries if e.is_file() and e.name.endswith(".json")]
+	if len(profiles) <= PROFILE_MAX_FILES:
+		return
+	profiles.sort(key=lambda e: e.stat().st_mtime)
+	for entry in profiles[:len(profiles) - PROFILE_MAX_FILES]:
+		try:
+			os.remove(entry.path)
+		except FileNotFoundError:
+			pass  # pruned by a concurrent write
+
+
+def load_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+	if not profile_id.isalnum():
+		return None
+	try:
+		with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "r", encoding="utf-8") as fh:
+			return json.load(fh)
+	except FileNotFoundError:
+		return None
+
+
+def _wants_profile(scope: Dict[str, Any]) -> bool:
+	for name, value in scope.get("headers", []):
+		if name == b"x-profile":
+			return value in (b"1", b"true")
+	query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+	return query.get("profile", [""])[0] in ("1", "true")
+
+
+class ProfilingMiddleware:
+	"""ASGI middleware: profile requests sent with ``X-Profile: 1`` or ``?profile=1``.
+
+	The response carries ``X-Profile-Id``; the profile is written to
+	PROFILE_DIR once the request finishes. Other requests pass straight through.
+	"""
+
+	def __init__(self, app: Callable[..., Awaitable[None]]) -> None:
+		self.app = app
+
+	async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+		session = None
+		if scope["type"] == "http" and _wants_profile(scope):
+			session = begin_profile(f"{scope['method']} {scope['path']}")
+		if session is None:
+			await self.app(scope, receive, send)
+			return
+
+		async def send_with_id(message: Dict[str, Any]) -> None:
+			if message["type"] == "http.response.start":
+				headers = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+				message = {**message, "headers": headers}
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_with_id)
+		finally:
+			await end_profile(session)
+
+
+class LoopLagMonitor:
+	"""Log when the event loop is blocked for longer than ``threshold``, and by what.
+
+	A heartbeat coroutine measures how late its sleeps wake up. A watchdog
+	thread notices a heartbeat that is overdue by ``threshold`` while the stall
+	is still happening and captures the task and stack holding the loop.
+	"""
+
+	def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS) -> None:
+		self.threshold = threshold_ms / 1000
+		self.interval = self.threshold / 2
+		self.stalls = 0
+		self.max_lag_ms = 0.0
+		self.last_stall: Optional[Dict[str, Any]] = None
+		self._due = 0.0
+		self._culprit: Optional[Dict[str, Any]] = None
+		self._stop = threading.Event()
+
+	async def run(self) -> None:
+		loop = asyncio.get_running_loop()
+		watchdog = threading.Thread(target=self._watch, args=(loop, threading.get_ident()), name="loop-lag", daemon=True)
+		watchdog.start()
+		try:
+			while True:
+				self._culprit = None
+				self._due = time.monotonic() + self.interval
+				await asyncio.sleep(self.interval)
+				lag = time.monotonic() - self._due
+				if lag >= self.threshold:
+					self._report(lag)
+		finally:
+			self._stop.set()
+
+	def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+		while not self._stop.wait(self.interval / 2):
+			if self._culprit is None and time.monotonic() - self._due >= self.threshold:
+				task = asyncio.current_task(loop)
+				stack = _thread_stack(sys._current_frames().get(loop_thread))
+				self._culprit = {"task": _task_name(task), "stack": stack[-5:]}
+
+	def _report(self, lag: float) -> None:
+		lag_ms = round(lag * 1000, 1)
+		culprit = self._culprit or {"task": "[unknown]", "stack": []}
+		self.stalls += 1
+		self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+		self.last_stall = {"lag_ms": lag_ms, **culprit}
+		where = " <- ".join(reversed(culprit["stack"])) or "?"
+		print(f"[loop-lag] event loop blocked {lag_ms}ms by {culprit['task']} at {where}")
+
+	def snapshot(self) -> Dict[str, Any]:
+		return {"threshold_ms": self.threshold * 1000, "stalls": self.stalls, "max_lag_ms": self.max_lag_ms, "last_stall": self.last_stall}
+
+
+loop_lag_monitor = LoopLagMonitor()
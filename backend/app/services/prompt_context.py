@@ -0,0 +1,117 @@
+import os
+import re
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+# Token budget for the data/context part of a prompt (system instructions excluded)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=1)
+def _encoder() -> Optional[Any]:
+	try:
+		import tiktoken
+		return tiktoken.get_encoding("cl100k_base")
+	except Exception:  # noqa: BLE001  optional, and may need its BPE file on first use
+		return None
+
+
+def count_tokens(text: str) -> int:
+	"""Count tokens locally: tiktoken when installed, else a word/punctuation estimate."""
+	if not text:
+		return 0
+	enc = _encoder()
+	if enc is not None:
+		return len(enc.encode(text))
+	# Long words split into several BPE tokens; ~4 chars per token is a fair average
+	return sum(max(1, len(t) // 4) for t in _TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+	if max_tokens <= 0:
+		return ""
+	if count_tokens(text) <= max_tokens:
+		return text
+	max_tokens = max(max_tokens - count_tokens(suffix), 0)
+	enc = _encoder()
+	if enc is not None:
+		return enc.decode(enc.encode(text)[:max_tokens]).rstrip() + suffix
+	# Binary search on characters for the heuristic counter
+	lo, hi = 0, len(text)
+	while lo < hi:
+		mid = (lo + hi + 1) // 2
+		if count_tokens(text[:mid]) <= max_tokens:
+			lo = mid
+		else:
+			hi = mid - 1
+	return text[:lo].rstrip() + suffix
+
+
+def _normalize(text: str) -> str:
+	return re.sub(r"\W+", " ", text.lower()).strip()
+
+
+def dedupe(items: Iterable[str]) -> List[str]:
+	"""Drop empty and case/punctuation-insensitive duplicate strings, keeping order."""
+	seen = set()
+	out = []
+	for item in items:
+		key = _normalize(item or "")
+		if key and key not in seen:
+			seen.add(key)
+			out.append(item)
+	return out
+
+
+def rank_snippets(results: Sequence[dict], terms: Iterable[str]) -> List[dict]:
+	"""De-duplicate web results by URL/title and order them by query-term overlap."""
+	wanted = {t for t in _normalize(" ".join(terms)).split() if len(t) > 2}
+	seen = set()
+	scored: List[Tuple[int, int, dict]] = []
+	for pos, res in enumerate(results):
+		key = (res.get("href") or "").rstrip("/").lower() or _normalize(res.get("title", ""))
+		if not key or key in seen:
+			continue
+		seen.add(key)
+		words = set(_normalize(f"{res.get('title', '')} {res.get('body', '')}").split())
+		scored.append((-len(wanted & words), pos, res))
+	return [res for _, _, res in sorted(scored, key=lambda s: s[:2])]
+
+
+def fit_items(items: Sequence[str], budget: int, max_item_tokens: Optional[int] = None, sep: str = ", ") -> List[str]:
+	"""Keep items in order until ``budget`` tokens are used, truncating long ones first."""
+	kept: List[str] = []
+	used = 0
+	sep_tokens = count_tokens(sep)
+	for item in items:
+		if max_item_tokens:
+			item = truncate_to_tokens(item, max_item_tokens)
+		cost = count_tokens(item) + (sep_tokens if kept else 0)
+		if used + cost > budget:
+			break
+		kept.append(item)
+		used += cost
+	return kept
+
+
+def compact_context(required: List[str], optional: List[str], budget: int = PROMPT_TOKEN_BUDGET) -> str:
+	"""Join ``required`` lines, then as many ``optional`` blocks as fit.
+
+	Optional blocks must be passed most valuable first; the first block that
+	does not fit is truncated to the remaining budget and the rest are dropped.
+	"""
+	parts = list(required)
+	used = count_tokens("\n".join(parts))
+	for block in optional:
+		cost = count_tokens(block) + 1
+		if used + cost <= budget:
+			parts.append(block)
+			used += cost
+			continue
+		left = budget - used - 1
+		if left > 8:
+			parts.append(truncate_to_tokens(block, left))
+		break
+	return "\n".join(parts)
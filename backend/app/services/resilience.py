@@ -0,0 +1,180 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+import httpx
+from tenacity import retry_if_exception
+
+from .latency import BudgetExhausted
+from .scheduler import scheduler_for
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+	"""Raised instead of calling an upstream whose circuit is open."""
+
+	def __init__(self, source: str) -> None:
+		super().__init__(f"{source} circuit is open")
+		self.source = source
+
+
+class CircuitBreaker:
+	"""Consecutive-failure circuit breaker for a single upstream.
+
+	closed -> open after ``failure_threshold`` consecutive failures; open fails
+	fast for ``reset_timeout`` seconds, then half_open lets a single probe
+	through, which either closes the circuit or re-opens it.
+	"""
+
+	def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT) -> None:
+		self.name = name
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.failures = 0
+		self.opened_at = 0.0
+		self._state = "closed"
+		self._probe_in_flight = False
+
+	@property
+	def state(self) -> str:
+		if self._state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+			self._state = "half_open"
+			self._probe_in_flight = False
+		return self._state
+
+	def allow(self) -> bool:
+		state = self.state
+		if state == "closed":
+			return True
+		if state == "half_open" and not self._probe_in_flight:
+			self._probe_in_flight = True
+			return True
+		return False
+
+	def record_success(self) -> None:
+		self.failures = 0
+		self._state = "closed"
+		self._probe_in_flight = False
+
+	def release_probe(self) -> None:
+		self._probe_in_flight = False
+
+	def record_failure(self) -> None:
+		self.failures += 1
+		if self._state == "half_open" or self.failures >= self.failure_threshold:
+			self._state = "open"
+			self.opened_at = time.monotonic()
+			self._probe_in_flight = False
+			print(f"[circuit] {self.name} opened after {self.failures} consecutive failures")
+
+	def snapshot(self) -> Dict[str, object]:
+		return {"state": self.state, "failures": self.failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(source: str) -> CircuitBreaker:
+	breaker = _breakers.get(source)
+	if breaker is None:
+		breaker = _breakers[source] = CircuitBreaker(source)
+	return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, object]]:
+	return {name: b.snapshot() for name, b in _breakers.items()}
+
+
+def _is_upstream_failure(exc: Exception) -> bool:
+	# The caller's budget ran out; says nothing about the upstream
+	if isinstance(exc, BudgetExhausted):
+		return False
+	# 4xx responses (other than throttling) mean a bad request, not a sick upstream
+	if isinstance(exc, httpx.HTTPStatusError):
+		status = exc.response.status_code
+		return status >= 500 or status == 429
+	return True
+
+
+@contextmanager
+def circuit(source: str) -> Iterator[None]:
+	breaker = get_breaker(source)
+	if not breaker.allow():
+		raise CircuitOpenError(source)
+	try:
+		yield
+	except BudgetExhausted:
+		# No verdict on the upstream, but free the half-open probe
+		breaker.release_probe()
+		raise
+	except Exception as exc:
+		if _is_upstream_failure(exc):
+			breaker.record_failure()
+		else:
+			breaker.record_success()
+		raise
+	except BaseException:
+		# Cancelled: no verdict on the upstream, but free the half-open probe
+		breaker.release_probe()
+		raise
+	else:
+		breaker.record_success()
+
+
+@asynccontextmanager
+async def upstream_call(source: str) -> AsyncIterator[None]:
+	"""Guard a single call to ``source``; every upstream fetch goes through here.
+
+	Fails fast on an open circuit, then waits for a slot under the caller's
+	priority class before making the call. The call's latency and outcome
+	adjust the source's adaptive concurrency limit.
+	"""
+	if get_breaker(source).state == "open":
+		raise CircuitOpenError(source)
+	scheduler = scheduler_for(source)
+	async with scheduler.slot():
+		with scheduler.limit.measure(), circuit(source):
+			yield
+
+
+def _consume_result(task: asyncio.Task) -> None:
+	# Retrieve the outcome so an abandoned call does not log "exception was never retrieved"
+	if not task.cancelled():
+		task.exception()
+
+
+async def blocking_upstream_call(source: str, fn: Callable[..., Any], *args: Any) -> Any:
+	"""Run blocking ``fn(*args)`` in a thread under ``upstream_call(source)``.
+
+	A thread cannot be cancelled, so once it has started the slot is held
+	until it returns even if the caller gives up (hedge loser, budget):
+	otherwise abandoned calls would push real upstream concurrency past the
+	scheduler and adaptive limit. A caller cancelled while still queued for
+	a slot withdraws without starting the thread.
+	"""
+	started = asyncio.Event()
+
+	async def run() -> Any:
+		async with upstream_call(source):
+			started.set()
+			return await asyncio.to_thread(fn, *args)
+
+	task = asyncio.ensure_future(run())
+	task.add_done_callback(_consume_result)
+	try:
+		return await asyncio.shield(task)
+	except asyncio.CancelledError:
+		if not started.is_set():
+			task.cancel()
+		raise
+
+
+# Use as tenacity's ``retry=`` so an open circuit is not retried with backoff
+# (and cancellation, a BaseException, is never retried)
+retry_unless_circuit_open = retry_if_exception(
+	lambda exc: isinstance(exc, Exception) and not isinstance(exc, CircuitOpenError)
+)
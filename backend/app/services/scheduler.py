@@ -0,0 +1,155 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import Context, ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, Literal, Optional
+
+from .adaptive import AIMDLimit, get_limit
+
+Priority = Literal["interactive", "standard", "bulk"]
+
+# Share of contended slots each class receives relative to the others
+PRIORITY_WEIGHTS: Dict[str, float] = {
+	"interactive": float(os.getenv("PRIORITY_WEIGHT_INTERACTIVE", "16")),
+	"standard": float(os.getenv("PRIORITY_WEIGHT_STANDARD", "4")),
+	"bulk": float(os.getenv("PRIORITY_WEIGHT_BULK", "1")),
+}
+# Ceilings for each upstream's adaptive concurrency limit
+UPSTREAM_SLOTS = int(os.getenv("UPSTREAM_SLOTS", "32"))
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "8"))
+# Batches larger than this default to the bulk class
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "25"))
+
+_current_priority: ContextVar[str] = ContextVar("profile_priority", default="standard")
+
+
+@contextmanager
+def priority_scope(priority: str) -> Iterator[None]:
+	"""Run everything awaited inside the block under ``priority``."""
+	token = _current_priority.set(priority)
+	try:
+		yield
+	finally:
+		_current_priority.reset(token)
+
+
+def current_priority() -> str:
+	return _current_priority.get()
+
+
+def priority_context() -> Context:
+	"""A fresh context carrying only the caller's priority class (no deadline or other state)."""
+	context = Context()
+	context.run(_current_priority.set, _current_priority.get())
+	return context
+
+
+def default_priority(batch_size: int) -> str:
+	if batch_size <= 1:
+		return "interactive"
+	return "bulk" if batch_size > BULK_BATCH_SIZE else "standard"
+
+
+class FairScheduler:
+	"""Weighted fair queuing over a number of slots, fixed or set by an AIMDLimit.
+
+	Free slots are granted immediately. Under contention, waiting classes are
+	served in order of their virtual finish time (start-time fair queuing), so
+	each class gets slots in proportion to its weight and bulk work still
+	progresses, but only on capacity interactive work is not using.
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		capacity: int,
+		weights: Dict[str, float] = PRIORITY_WEIGHTS,
+		limit: Optional[AIMDLimit] = None,
+	) -> None:
+		self.name = name
+		self._capacity = capacity
+		self.limit = limit
+		self.weights = weights
+		self.in_use = 0
+		self._waiters: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in weights}
+		self._finish: Dict[str, float] = {p: 0.0 for p in weights}
+		self._virtual_time = 0.0
+
+	@property
+	def capacity(self) -> int:
+		"""Slots currently available: the adaptive limit when one is attached."""
+		return self.limit.limit if self.limit is not None else self._capacity
+
+	def _has_waiters(self) -> bool:
+		return any(self._waiters.values())
+
+	def _dispatch(self) -> None:
+		while self.in_use < self.capacity:
+			best = None
+			best_tag = 0.0
+			for priority, waiters in self._waiters.items():
+				while waiters and waiters[0].done():  # cancelled while queued
+					waiters.popleft()
+				if not waiters:
+					continue
+				tag = max(self._finish[priority], self._virtual_time) + 1 / self.weights[priority]
+				if best is None or tag < best_tag:
+					best, best_tag = priority, tag
+			if best is None:
+				return
+			self._finish[best] = best_tag
+			self._virtual_time = best_tag - 1 / self.weights[best]
+			self.in_use += 1
+			self._waiters[best].popleft().set_result(None)
+
+	async def acquire(self, priority: str) -> None:
+		if priority not in self._waiters:
+			priority = "standard"
+		if self.in_use < self.capacity and not self._has_waiters():
+			self.in_use += 1
+			return
+		fut = asyncio.get_running_loop().create_future()
+		self._waiters[priority].append(fut)
+		try:
+			await fut
+		except asyncio.CancelledError:
+			if fut.done() and not fut.cancelled():
+				# Slot was granted just as we were cancelled: hand it on
+				self.release()
+			raise
+
+	def release(self) -> None:
+		self.in_use -= 1
+		self._dispatch()
+
+	@asynccontextmanager
+	async def slot(self, priority: str = "") -> AsyncIterator[None]:
+		await self.acquire(priority or current_priority())
+		try:
+			yield
+		finally:
+			self.release()
+
+	def snapshot(self) -> Dict[str, object]:
+		return {
+			"capacity": self.capacity,
+			"in_use": self.in_use,
+			"waiting": {p: sum(1 for f in w if not f.done()) for p, w in self._waiters.items()},
+		}
+
+
+_schedulers: Dict[str, FairScheduler] = {}
+
+
+def scheduler_for(source: str) -> FairScheduler:
+	"""Per-upstream scheduler whose capacity tracks that upstream's adaptive limit."""
+	scheduler = _schedulers.get(source)
+	if scheduler is None:
+		ceiling = LLM_SLOTS if source == "llm" else UPSTREAM_SLOTS
+		scheduler = _schedulers[source] = FairScheduler(source, ceiling, limit=get_limit(source, ceiling))
+	return scheduler
+
+
+def scheduler_states() -> Dict[str, Dict[str, object]]:
+	return {name: s.snapshot() for name, s in _schedulers.items()}
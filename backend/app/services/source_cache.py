@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .scheduler import priority_context
+
+SOURCE_CACHE_TTL = float(os.getenv("SOURCE_CACHE_TTL", "900"))
+SOURCE_CACHE_SIZE = int(os.getenv("SOURCE_CACHE_SIZE", "10000"))
+
+Key = Tuple[str, str]
+# Entries one profiled NPI can occupy: the registry record plus a PubMed search per pipeline
+ENTRIES_PER_NPI = 3
+
+
+def _consume_result(task: asyncio.Task) -> None:
+	# Retrieve the outcome so a fetch every caller gave up on does not log "exception was never retrieved"
+	if not task.cancelled():
+		task.exception()
+
+
+class SourceCache:
+	"""In-process TTL cache of upstream responses, keyed by (source, query).
+
+	Concurrent misses for the same key share one fetch, so a profile request
+	that arrives while a prefetch for the same NPI is in flight waits for that
+	fetch instead of issuing a duplicate. The shared fetch runs in the first
+	caller's priority class but without its latency budget, so one caller's
+	deadline does not fail the fetch for the others; each caller still
+	abandons it at its own deadline. Only successful responses are kept.
+	"""
+
+	def __init__(self, ttl: float = SOURCE_CACHE_TTL, max_entries: int = SOURCE_CACHE_SIZE) -> None:
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self._entries: "OrderedDict[Key, Tuple[float, Any]]" = OrderedDict()
+		self._inflight: Dict[Key, asyncio.Task] = {}
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, source: str, query: str) -> Optional[Any]:
+		entry = self._entries.get((source, query))
+		if entry is None or entry[0] < time.monotonic():
+			return None
+		return entry[1]
+
+	def put(self, source: str, query: str, value: Any) -> None:
+		if self.ttl <= 0:
+			return
+		key = (source, query)
+		self._entries[key] = (time.monotonic() + self.ttl, value)
+		self._entries.move_to_end(key)
+		# Every entry has the same TTL, so the oldest insert expires first
+		now = time.monotonic()
+		while self._entries:
+			oldest_key, (expires, _) = next(iter(self._entries.items()))
+			if expires >= now and len(self._entries) <= self.max_entries:
+				break
+			del self._entries[oldest_key]
+
+	async def get_or_fetch(self, source: str, query: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+		cached = self.get(source, query)
+		if cached is not None:
+			self.hits += 1
+			return cached
+		key = (source, query)
+		task = self._inflight.get(key)
+		if task is None:
+			self.misses += 1
+			task = asyncio.get_running_loop().create_task(self._load(key, fetch), context=priority_context())
+			task.add_done_callback(_consume_result)
+			self._inflight[key] = task
+		else:
+			self.hits += 1
+		# Shielded: a caller giving up (budget, disconnect) does not cancel a fetch others share
+		return await asyncio.shield(task)
+
+	async def _load(self, key: Key, fetch: Callable[[], Awaitable[Any]]) -> Any:
+		try:
+			value = await fetch()
+			self.put(key[0], key[1], value)
+			return value
+		finally:
+			self._inflight.pop(key, None)
+
+	def npi_capacity(self) -> int:
+		"""NPIs whose source data fits in the cache at once."""
+		return self.max_entries // ENTRIES_PER_NPI
+
+	def clear(self) -> None:
+		self._entries.clear()
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"entries": len(self._entries),
+			"inflight": len(self._inflight),
+			"hits": self.hits,
+			"misses": self.misses,
+		}
+
+
+source_cache = SourceCache()
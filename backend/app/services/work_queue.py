@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+QUEUE_PATH = os.getenv("HCP_QUEUE_PATH", "hcp_queue.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	batch_id TEXT NOT NULL,
+	npi TEXT NOT NULL,
+	depth TEXT NOT NULL,
+	confidence_threshold INTEGER NOT NULL,
+	status TEXT NOT NULL DEFAULT 'pending',
+	attempts INTEGER NOT NULL DEFAULT 0,
+	worker_id TEXT,
+	lease_until REAL,
+	result TEXT,
+	error TEXT,
+	created_at REAL NOT NULL,
+	updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (status, lease_until);
+CREATE INDEX IF NOT EXISTS idx_tasks_batch ON tasks (batch_id);
+"""
+
+
+class WorkQueue:
+	"""SQLite-backed task queue shared by API and worker processes on one host.
+
+	The database must live on a local disk: WAL mode and SQLite's file locking
+	do not work reliably over NFS/SMB.
+
+	Workers claim tasks under a time-limited lease; a task whose lease expires
+	(crashed or stalled worker) becomes claimable again. Failed tasks are retried,
+	optionally after a delay, until ``max_attempts`` and then marked ``failed``.
+	"""
+
+	def __init__(self, path: str = QUEUE_PATH, max_attempts: int = 3) -> None:
+		self.path = path
+		self.max_attempts = max_attempts
+		with self._connect() as conn:
+			conn.executescript(_SCHEMA)
+
+	@contextmanager
+	def _connect(self) -> Iterator[sqlite3.Connection]:
+		conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+		try:
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.row_factory = sqlite3.Row
+			yield conn
+		finally:
+			conn.close()
+
+	def enqueue(self, npi_list: List[str], depth: str = "deep", confidence_threshold: int = 70, batch_id: Optional[str] = None) -> str:
+		batch_id = batch_id or uuid.uuid4().hex
+		now = time.time()
+		rows = [(batch_id, npi, depth, confidence_threshold, now, now) for npi in npi_list]
+		with self._connect() as conn:
+			conn.execute("BEGIN")
+			conn.executemany(
+				"INSERT INTO tasks (batch_id, npi, depth, confidence_threshold, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+				rows,
+			)
+			conn.execute("COMMIT")
+		return batch_id
+
+	def claim(self, worker_id: str, lease_seconds: float = 300, limit: int = 1) -> List[Dict[str, Any]]:
+		"""Atomically lease up to ``limit`` pending or expired tasks."""
+		now = time.time()
+		with self._connect() as conn:
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				# Leases that expired on their last attempt are not retried again
+				conn.execute(
+					"UPDATE tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), lease_until = NULL, updated_at = ? "
+					"WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+					(now, now, self.max_attempts),
+				)
+				rows = conn.execute(
+					"SELECT id, batch_id, npi, depth, confidence_threshold, attempts FROM tasks "
+					"WHERE (status = 'pending' AND (lease_until IS NULL OR lease_until < ?)) "
+					"OR (status = 'running' AND lease_until < ?) "
+					"ORDER BY id LIMIT ?",
+					(now, now, limit),
+				).fetchall()
+				for row in rows:
+					conn.execute(
+						"UPDATE tasks SET status = 'running', worker_id = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+						(worker_id, now + lease_seconds, now, row["id"]),
+					)
+				conn.execute("COMMIT")
+			except Exception:
+				conn.execute("ROLLBACK")
+				raise
+		return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+	def extend_lease(self, task_id: int, worker_id: str, lease_seconds: float = 300) -> bool:
+		now = time.time()
+		with self._connect() as conn:
+			cur = conn.execute(
+				"UPDATE tasks SET lease_until = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+				(now + lease_seconds, now, task_id, worker_id),
+			)
+		return cur.rowcount == 1
+
+	def complete(self, task_id: int, worker_id: str, result: Dict[str, Any]) -> None:
+		with self._connect() as conn:
+			conn.execute(
+				"UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_until = NULL, updated_at = ? WHERE id = ? AND worker_id = ?",
+				(json.dumps(result, default=str), time.time(), task_id, worker_id),
+			)
+
+	def fail(self, task_id: int, worker_id: str, error: str, retry_after: float = 0) -> None:
+		"""Record a failed attempt; a retried task is not claimable for ``retry_after`` seconds."""
+		now = time.time()
+		with self._connect() as conn:
+			conn.execute(
+				"UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+				"error = ?, lease_until = CASE WHEN attempts >= ? THEN NULL ELSE ? END, updated_at = ? "
+				"WHERE id = ? AND worker_id = ?",
+				(self.max_attempts, error, self.max_attempts, now + retry_after, now, task_id, worker_id),
+			)
+
+	def batch_status(self, batch_id: str, include_results: bool = False, offset: int = 0, limit: int = 500) -> Optional[Dict[str, Any]]:
+		"""Counts per status; with ``include_results``, one page of results and failures (by task order)."""
+		with self._connect() as conn:
+			counts = {
+				row["status"]: row["n"]
+				for row in conn.execute("SELECT status, COUNT(*) AS n FROM tasks WHERE batch_id = ? GROUP BY status", (batch_id,))
+			}
+			if not counts:
+				return None
+			total = sum(counts.values())
+			status: Dict[str, Any] = {
+				"batch_id": batch_id,
+				"total": total,
+				"counts": counts,
+				"complete": counts.get("done", 0) + counts.get("failed", 0) == total,
+			}
+			if include_results:
+				done = conn.execute(
+					"SELECT result FROM tasks WHERE batch_id = ? AND status = 'done' ORDER BY id LIMIT ? OFFSET ?",
+					(batch_id, limit, offset),
+				).fetchall()
+				failed = conn.execute(
+					"SELECT npi, attempts, error FROM tasks WHERE batch_id = ? AND status = 'failed' ORDER BY id LIMIT ? OFFSET ?",
+					(batch_id, limit, offset),
+				).fetchall()
+				status.update(
+					offset=offset,
+					limit=limit,
+					results=[json.loads(row["result"]) for row in done if row["result"]],
+					errors=[dict(row) for row in failed],
+				)
+		return status
@@ -0,0 +1,101 @@
+"""Queue worker: claims NPI tasks from the shared work queue and profiles them.
+
+Run any number of these on the host that owns HCP_QUEUE_PATH (SQLite is not
+safe to share over a network filesystem):
+
+    python -m app.worker --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from .services.agents import run_agents_orchestrator
+from .services.scheduler import priority_scope
+from .services.work_queue import QUEUE_PATH, WorkQueue
+
+# The pipeline skips failing sources rather than raising, so a profile missing
+# one of these is treated as a failed attempt (an outage) and retried
+REQUIRED_SOURCES = {"registry": ("npi_registry",)}
+DEFAULT_REQUIRED_SOURCES = ("npi_registry", "pubmed")
+
+
+def _missing_sources(depth: str, profile: dict) -> list:
+	required = REQUIRED_SOURCES.get(depth, DEFAULT_REQUIRED_SOURCES)
+	return [source for source in profile.get("skippedSources") or [] if source in required]
+
+
+async def _keep_lease(queue: WorkQueue, task_id: int, worker_id: str, lease_seconds: float) -> None:
+	while True:
+		await asyncio.sleep(lease_seconds / 3)
+		await asyncio.to_thread(queue.extend_lease, task_id, worker_id, lease_seconds)
+
+
+async def _worker_slot(queue: WorkQueue, worker_id: str, lease_seconds: float, poll_interval: float, retry_delay: float, stop: asyncio.Event) -> None:
+	while not stop.is_set():
+		tasks = await asyncio.to_thread(queue.claim, worker_id, lease_seconds)
+		if not tasks:
+			try:
+				await asyncio.wait_for(stop.wait(), timeout=poll_interval)
+			except asyncio.TimeoutError:
+				pass
+			continue
+
+		task = tasks[0]
+		# Back off exponentially so retries outlast a short upstream outage
+		retry_after = retry_delay * 2 ** (task["attempts"] - 1)
+		heartbeat = asyncio.create_task(_keep_lease(queue, task["id"], worker_id, lease_seconds))
+		try:
+			profile = await run_agents_orchestrator(task["npi"], task["depth"], task["confidence_threshold"])
+			missing = _missing_sources(task["depth"], profile)
+			if missing:
+				raise RuntimeError(f"required sources unavailable: {', '.join(missing)}")
+		except Exception as e:  # noqa: BLE001
+			print(f"[worker {worker_id}] task {task['id']} (NPI {task['npi']}) attempt {task['attempts']} failed: {e}")
+			await asyncio.to_thread(queue.fail, task["id"], worker_id, str(e), retry_after)
+		else:
+			await asyncio.to_thread(queue.complete, task["id"], worker_id, profile)
+		finally:
+			heartbeat.cancel()
+
+
+async def run_worker(queue_path: str, concurrency: int, lease_seconds: float, poll_interval: float, max_attempts: int, retry_delay: float = 30) -> None:
+	queue = WorkQueue(queue_path, max_attempts=max_attempts)
+	worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+	stop = asyncio.Event()
+	loop = asyncio.get_running_loop()
+	for sig in (signal.SIGINT, signal.SIGTERM):
+		try:
+			loop.add_signal_handler(sig, stop.set)
+		except NotImplementedError:  # Windows
+			pass
+
+	print(f"[worker {worker_id}] consuming {queue_path} with {concurrency} slots")
+	# Queued campaigns are background work; the slot tasks inherit this class
+	with priority_scope("bulk"):
+		await asyncio.gather(*[
+			_worker_slot(queue, worker_id, lease_seconds, poll_interval, retry_delay, stop) for _ in range(concurrency)
+		])
+	print(f"[worker {worker_id}] stopped")
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="HCP profiling queue worker")
+	parser.add_argument("--queue", default=QUEUE_PATH, help="SQLite queue path (default: HCP_QUEUE_PATH)")
+	parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")))
+	parser.add_argument("--lease", type=float, default=300, help="Task lease in seconds")
+	parser.add_argument("--poll-interval", type=float, default=1.0)
+	parser.add_argument("--max-attempts", type=int, default=3)
+	parser.add_argument("--retry-delay", type=float, default=30, help="Seconds before the first retry; doubles per attempt")
+	args = parser.parse_args()
+	asyncio.run(run_worker(args.queue, args.concurrency, args.lease, args.poll_interval, args.max_attempts, args.retry_delay))
+
+
+if __name__ == "__main__":
+	main()
@@ -4,11 +4,19 @@ import json
 import requests
 import pandas as pd
 import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import gender_guesser.detector as gender
 from dotenv import load_dotenv
 from openai import AzureOpenAI
 import urllib3
 
+from app.services.adaptive import get_blocking_limiter
+from app.services.scheduler import LLM_SLOTS
+from app.services.prompt_context import PROMPT_TOKEN_BUDGET, dedupe, fit_items
+
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -31,6 +39,26 @@ client = AzureOpenAI(
 )
 DEPLOYMENT_NAME = os.getenv("DEPLOYMENT_NAME")
 
+# Point at stub_server.py for local runs: http://127.0.0.1:8765/api/v2
+CLINICALTRIALS_API_BASE = os.getenv("CLINICALTRIALS_API_BASE", "https://clinicaltrials.gov/api/v2")
+
+# NPIs profiled in parallel; per-upstream concurrency is then set adaptively
+NPI_WORKERS = int(os.getenv("BACKEND_DATA_WORKERS", "16"))
+HTTP_TIMEOUT = float(os.getenv("BACKEND_DATA_HTTP_TIMEOUT", "30"))
+
+
+def fetch_json(source, url, session=None, **kwargs):
+    """GET ``url`` under ``source``'s adaptive concurrency limit.
+
+    Raises on HTTP errors so throttling (429) shrinks the limit. Always sets a
+    timeout: a hung connection would otherwise hold its limiter slot forever.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    with get_blocking_limiter(source).slot():
+        resp = (session or requests).get(url, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
 # =======================
 # Base Agent
 # =======================
@@ -40,14 +68,15 @@ class Agent:
 
     def call_llm(self, prompt):
         try:
-            resp = client.chat.completions.create(
-                model=DEPLOYMENT_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a structured data processing agent."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0
-            )
+            with get_blocking_limiter("llm", max_limit=LLM_SLOTS).slot():
+                resp = client.chat.completions.create(
+                    model=DEPLOYMENT_NAME,
+                    messages=[
+                        {"role": "system", "content": "You are a structured data processing agent."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0
+                )
             return resp.choices[0].message.content
         except Exception as e:
             print(f"[ERROR] LLM call failed: {e}")
@@ -63,7 +92,7 @@ class NPIAgent(Agent):
     def run(self, npi, profile):
         try:
             url = f"https://npiregistry.cms.hhs.gov/api/?number={npi}&version=2.1"
-            resp = requests.get(url, verify=False).json()
+            resp = fetch_json("npi_registry", url, verify=False)
 
             if "results" in resp:
                 result = resp["results"][0]
@@ -73,21 +102,12 @@ class NPIAgent(Agent):
                 profile["full_name"] = f"{profile['First_Name']} {profile['Last_Name']}".strip()
                 profile["Education"] = result['basic'].get('credential', '')
 
-                # Gender inference
-                first_name = result['basic'].get('first_name', '')
-                gender_value = result['basic'].get('gender', '')
-                if not gender_value and first_name:
-                    guess = d.get_gender(first_name)
-                    if guess in ["male", "mostly_male"]:
-                        gender_value = "Male"
-                    elif guess in ["female", "mostly_female"]:
-                        gender_value = "Female"
-                profile["Gender"] = gender_value
+                # Registry gender only; inference for blanks happens in enrich_profiles
+                profile["Gender"] = result['basic'].get('gender', '')
 
                 profile["specialty"] = result["taxonomies"][0].get("desc", "")
                 profile["Practice_City"] = result['addresses'][0].get('city', '')
                 profile["Practice_State"] = result['addresses'][0].get('state', '')
-                profile["location"] = f"{result['addresses'][0].get('city', '')}, {result['addresses'][0].get('state', '')}"
 
         except Exception as e:
             print(f"NPI Agent error for {npi}: {e}")
@@ -146,7 +166,7 @@ class PubMedAgent(Agent):
                 f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
                 f"?db=pubmed&term={lastname}+{firstname}[Author]&retmode=json&retmax=20"
             )
-            search_resp = requests.get(search_url).json()
+            search_resp = fetch_json("pubmed", search_url)
             pmids = search_resp.get("esearchresult", {}).get("idlist", [])
 
             if not pmids:
@@ -157,7 +177,7 @@ class PubMedAgent(Agent):
                 f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
                 f"?db=pubmed&id={','.join(pmids)}&retmode=json"
             )
-            summary_resp = requests.get(summary_url).json()
+            summary_resp = fetch_json("pubmed", summary_url)
             result = summary_resp.get("result", {})
 
             publications = []
@@ -208,12 +228,16 @@ class PubMedAgentWithImpact(PubMedAgent):
 
         # Only call LLM if there are top publications
         if profile.get("top_publication_journals"):
+            # Titles are the bulk of the prompt: de-duplicate, clip long ones,
+            # and keep only as many as the token budget allows
+            journals = fit_items(dedupe(profile.get("top_publication_journals", [])), PROMPT_TOKEN_BUDGET // 4, max_item_tokens=20)
+            titles = fit_items(dedupe(profile.get("top_publication_titles", [])), PROMPT_TOKEN_BUDGET // 2, max_item_tokens=40, sep="; ")
             llm_response = self.call_llm(
                 research_prompt_template.format(
                     full_name=profile.get("full_name", ""),
                     publication_years=profile.get("publication_years", ""),
-                    top_publication_journals=", ".join(profile.get("top_publication_journals", [])),
-                    top_publication_titles=", ".join(profile.get("top_publication_titles", [])),
+                    top_publication_journals=", ".join(journals),
+                    top_publication_titles="; ".join(titles),
                     num_publications=profile.get("num_publications", 0),
                 )
             )
@@ -266,12 +290,126 @@ Instructions:
 """
 
 
+# =======================
+# ClinicalTrials.gov v2 fetch layer
+# =======================
+# Field projection: only the pieces ClinicalTrialsAgent aggregates are returned
+CT_FIELDS = [
+    "NCTId",
+    "OverallStatus",
+    "Condition",
+    "InterventionName",
+    "OverallOfficialName",
+    "OverallOfficialRole",
+]
+CT_ACTIVE_STATUSES = {"RECRUITING", "NOT_YET_RECRUITING", "ACTIVE_NOT_RECRUITING", "ENROLLING_BY_INVITATION"}
+CT_COMPLETED_STATUSES = {"COMPLETED"}
+
+
+def iter_trials(query_term, session=None, page_size=100, max_pages=50):
+    """Yield studies one page at a time, following nextPageToken.
+
+    Only one page is held in memory; max_pages caps very prolific investigators.
+    """
+    session = session or requests.Session()
+    params = {
+        "query.term": query_term,
+        "fields": ",".join(CT_FIELDS),
+        "pageSize": page_size,
+        "format": "json",
+    }
+    for _ in range(max_pages):
+        data = fetch_json("clinicaltrials", f"{CLINICALTRIALS_API_BASE}/studies", session=session, params=params)
+        for study in data.get("studies", []):
+            yield study
+        token = data.get("nextPageToken")
+        if not token:
+            return
+        params["pageToken"] = token
+
+
+class TrialAggregate:
+    """Running counts over streamed studies; tracks at most max_keys distinct terms."""
+
+    def __init__(self, last_name, max_keys=500):
+        self.last_name = last_name.lower()
+        self.max_keys = max_keys
+        self.total = 0
+        self.active = 0
+        self.completed = 0
+        self.conditions = Counter()
+        self.interventions = Counter()
+        self.roles = Counter()
+
+    def _count(self, counter, values):
+        for value in values:
+            if value and (value in counter or len(counter) < self.max_keys):
+                counter[value] += 1
+
+    def add(self, study):
+        protocol = study.get("protocolSection", {})
+        status = protocol.get("statusModule", {}).get("overallStatus", "")
+        self.total += 1
+        if status in CT_ACTIVE_STATUSES:
+            self.active += 1
+        elif status in CT_COMPLETED_STATUSES:
+            self.completed += 1
+
+        self._count(self.conditions, protocol.get("conditionsModule", {}).get("conditions", []))
+        self._count(
+            self.interventions,
+            [i.get("name") for i in protocol.get("armsInterventionsModule", {}).get("interventions", [])],
+        )
+        officials = protocol.get("contactsLocationsModule", {}).get("overallOfficials", [])
+        self._count(
+            self.roles,
+            [
+                o.get("role", "").replace("_", " ").title()
+                for o in officials
+                if self.last_name and self.last_name in o.get("name", "").lower()
+            ],
+        )
+
+    def to_profile(self, profile, top_n=10):
+        profile["total_trials"] = self.total
+        profile["active_trials"] = self.active
+        profile["completed_trials"] = self.completed
+        profile["conditions"] = [c for c, _ in self.conditions.most_common(top_n)]
+        profile["interventions"] = [i for i, _ in self.interventions.most_common(top_n)]
+        profile["roles"] = [r for r, _ in self.roles.most_common()]
+        return profile
+
+
 # =======================
 # Agent 3: ClinicalTrials
 # =======================
 class ClinicalTrialsAgent(Agent):
+    def __init__(self):
+        # requests.Session is not thread-safe and process_npi_list runs on a thread pool
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def fetch_trials(self, npi, profile):
+        parts = profile.get("full_name", "").split()
+        if len(parts) < 2:
+            return profile
+        firstname, lastname = parts[0], parts[-1]
+        aggregate = TrialAggregate(lastname)
+        try:
+            for study in iter_trials(f'AREA[OverallOfficialName]"{firstname} {lastname}"', session=self.session):
+                aggregate.add(study)
+        except Exception as e:
+            print(f"[ERROR] ClinicalTrials fetch error for {npi} ({profile.get('full_name')}): {e}")
+        return aggregate.to_profile(profile)
+
     def run(self, npi, profile):
-        # ... fetch trial info first, save into profile ...
+        profile = self.fetch_trials(npi, profile)
 
         if profile.get("total_trials", 0) > 0:
             llm_response = self.call_llm(
@@ -303,26 +441,81 @@ class ClinicalTrialsAgent(Agent):
 
         return profile
 
+# =======================
+# Batch Enrichment
+# =======================
+@lru_cache(maxsize=None)
+def infer_gender(first_name):
+    guess = d.get_gender(first_name)
+    if guess in ["male", "mostly_male"]:
+        return "Male"
+    if guess in ["female", "mostly_female"]:
+        return "Female"
+    return ""
+
+
+def _join_list_column(series):
+    is_list = series.map(lambda v: isinstance(v, list))
+    if not is_list.any():
+        return series
+    exploded = series[is_list].explode().dropna().astype(str)
+    joined = exploded.groupby(level=0).agg(", ".join)
+    out = series.copy()
+    out[is_list] = ""
+    out.loc[joined.index] = joined
+    return out
+
+
+def enrich_profiles(df):
+    """Post-process a DataFrame of raw agent profiles in one pass.
+
+    Gender is inferred once per unique first name, location strings are built
+    column-wise and list fields are flattened to comma-separated strings.
+    """
+    if df.empty:
+        return df
+    df = df.copy()
+
+    if "First_Name" in df.columns:
+        if "Gender" not in df.columns:
+            df["Gender"] = ""
+        gender_col = df["Gender"].fillna("").astype(str)
+        first_names = df["First_Name"].fillna("").astype(str).str.strip()
+        missing = (gender_col == "") & (first_names != "")
+        if missing.any():
+            lookup = {name: infer_gender(name) for name in first_names[missing].unique()}
+            gender_col[missing] = first_names[missing].map(lookup)
+        df["Gender"] = gender_col
+
+    if "Practice_City" in df.columns and "Practice_State" in df.columns:
+        city = df["Practice_City"].fillna("").astype(str)
+        state = df["Practice_State"].fillna("").astype(str)
+        has_address = (city != "") | (state != "")
+        df["location"] = (city + ", " + state).where(has_address, "")
+
+    for col in df.columns[df.dtypes == object]:
+        df[col] = _join_list_column(df[col])
+
+    return df
+
+
 # =======================
 # Orchestrator
 # =======================
 def process_npi_list(npi_list, output_path="hcp_profiles.xlsx"):
     agents = [NPIAgent(), PubMedAgentWithImpact(), ClinicalTrialsAgent()]
-    profiles = []
 
-    for npi in npi_list:
+    def build_profile(npi):
         profile = {}
         for agent in agents:
             profile = agent.run(npi, profile)
+        return profile
 
-        # Clean up list fields before saving
-        for key, value in profile.items():
-            if isinstance(value, list):
-                profile[key] = ", ".join(map(str, value))  # join list into string
-                
-        profiles.append(profile)
+    # Threads only overlap the waiting; each upstream's limiter decides how many calls are in flight
+    with ThreadPoolExecutor(max_workers=NPI_WORKERS) as pool:
+        profiles = list(pool.map(build_profile, npi_list))
 
-    df = pd.DataFrame(profiles)
+    df = enrich_profiles(pd.DataFrame(profiles))
     df.to_excel(output_path, index=False)
     print(f"✅ Saved {len(profiles)} profiles to {output_path}")
 
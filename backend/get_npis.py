@@ -1,9 +1,60 @@
-import json, urllib.request, sys
-state = sys.argv[1] if len(sys.argv) > 1 else 'CA'
-url=f'https://npiregistry.cms.hhs.gov/api/?version=2.1&enumeration_type=NPI-1&state={state}&limit=5'
-with urllib.request.urlopen(url, timeout=20) as r:
-    data=json.load(r)
-for res in data.get('results', [])[:5]:
-    n = res.get('number')
-    if n:
-        print(n)
+"""Enumerate NPIs from the NPI Registry.
+
+    python get_npis.py CA                                  # all individual NPIs in CA
+    python get_npis.py CA --city BOSTON --taxonomy "Cardiology" --max 500
+    python get_npis.py CA --taxonomy Oncology --enqueue    # feed queue workers
+"""
+import argparse
+import asyncio
+import sys
+
+from app.services.discovery import NPIDiscovery
+
+
+async def main(args):
+    filters = {
+        "state": args.state,
+        "city": args.city,
+        "postal_code": args.postal_code,
+        "taxonomy_description": args.taxonomy,
+        "first_name": args.first_name,
+        "last_name": args.last_name,
+    }
+    discovery = NPIDiscovery(concurrency=args.concurrency)
+    queue = batch_id = None
+    if args.enqueue:
+        from app.services.work_queue import WorkQueue
+        queue = WorkQueue()
+    chunk = []
+    count = 0
+    try:
+        async for npi in discovery.iter_npis(filters, max_results=args.max):
+            count += 1
+            if queue is None:
+                print(npi)
+                continue
+            chunk.append(npi)
+            if len(chunk) >= 500:
+                batch_id = queue.enqueue(chunk, args.depth, batch_id=batch_id)
+                chunk = []
+        if queue is not None and chunk:
+            batch_id = queue.enqueue(chunk, args.depth, batch_id=batch_id)
+    finally:
+        await discovery.aclose()
+    if queue is not None:
+        print(f"Enqueued {count} NPIs as batch {batch_id}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover NPIs by state, city, taxonomy and name")
+    parser.add_argument("state", nargs="?", default="CA")
+    parser.add_argument("--city")
+    parser.add_argument("--postal-code")
+    parser.add_argument("--taxonomy", help="Taxonomy description, e.g. 'Cardiology'")
+    parser.add_argument("--first-name")
+    parser.add_argument("--last-name", help="Exact name or trailing wildcard, e.g. 'SM*'")
+    parser.add_argument("--max", type=int, default=None, help="Stop after this many NPIs")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--enqueue", action="store_true", help="Add NPIs to the work queue instead of printing")
+    parser.add_argument("--depth", default="deep", choices=["registry", "standard", "deep", "adaptive"])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""Soak test: profile thousands of NPIs against the local stub upstreams and
+check that RSS and file-descriptor counts stay flat.
+
+    python soak.py --npis 5000 --concurrency 20
+
+The default ``--depth deep`` also runs every NPI through the AsyncOpenAI
+client, pointed at the stub's chat-completions route via OPENAI_BASE_URL.
+
+Exits non-zero when growth after warm-up exceeds the thresholds.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+
+from stub_server import start_stub_server
+
+_server, _base_url = start_stub_server()
+# Must be set before the app modules read their configuration
+os.environ["NPI_API_URL"] = f"{_base_url}/api/"
+os.environ["PUBMED_ESEARCH_URL"] = f"{_base_url}/entrez/eutils/esearch.fcgi"
+os.environ["OPENAI_BASE_URL"] = f"{_base_url}/v1"
+os.environ["OPENAI_API_KEY"] = "stub"
+
+from app.services import agents, diagnostics  # noqa: E402
+
+
+def stub_web_search(self, query, max_results):
+    # DuckDuckGo has no URL to point at a stub, so replace the blocking call itself
+    return [
+        {"title": f"{query} - LinkedIn", "href": "https://www.linkedin.com/in/stub", "body": "Cardiology research news"},
+        {"title": f"{query} - Hospital", "href": "https://hospital.example/stub", "body": "Clinical education"},
+    ][:max_results]
+
+
+def sample():
+    gc.collect()
+    fds = diagnostics.fd_stats()
+    return diagnostics.rss_bytes() / (1024 * 1024), fds["open_fds"] or 0, diagnostics.live_objects()
+
+
+async def run(total, concurrency, depth):
+    agents.AgentTools._web_search_sync = stub_web_search
+    npis = [f"{1000000000 + i}" for i in range(total)]
+    sem = asyncio.Semaphore(concurrency)
+    warmup = max(total // 10, concurrency)
+    baseline = None
+
+    async def one(npi):
+        async with sem:
+            profile = await agents.run_agents_orchestrator(npi, depth)
+            if profile.get("skippedSources"):
+                raise RuntimeError(f"{npi}: skipped {profile['skippedSources']}")
+
+    for start in range(0, total, warmup):
+        await asyncio.gather(*[one(n) for n in npis[start:start + warmup]])
+        rss, fds, objects = sample()
+        print(f"[soak] {min(start + warmup, total)}/{total} rss={rss:.1f}MB fds={fds} tasks={len(asyncio.all_tasks())} objects={objects}")
+        if baseline is None:
+            baseline = (rss, fds)
+
+    # Sample while the shared clients are still open, as they are in a running server
+    final = sample()
+    await agents.close_agent_clients()
+    return baseline, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resource-leak soak test against local stubs")
+    parser.add_argument("--npis", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--depth", default="deep", choices=["registry", "standard", "adaptive", "deep"])
+    parser.add_argument("--max-rss-growth-mb", type=float, default=25.0)
+    parser.add_argument("--max-fd-growth", type=int, default=10)
+    args = parser.parse_args()
+
+    (rss0, fds0), (rss1, fds1, _) = asyncio.run(run(args.npis, args.concurrency, args.depth))
+    _server.shutdown()
+    print(f"[soak] rss {rss0:.1f} -> {rss1:.1f} MB, fds {fds0} -> {fds1}")
+    failures = []
+    if rss1 - rss0 > args.max_rss_growth_mb:
+        failures.append(f"RSS grew {rss1 - rss0:.1f}MB (limit {args.max_rss_growth_mb}MB)")
+    if fds1 - fds0 > args.max_fd_growth:
+        failures.append(f"fds grew by {fds1 - fds0} (limit {args.max_fd_growth})")
+    if failures:
+        print("[soak] FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("[soak] OK")
+
+
+if __name__ == "__main__":
+    main()
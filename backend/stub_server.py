@@ -0,0 +1,180 @@
+"""Local stand-in for upstream APIs, for offline runs and tests.
+
+Serves deterministic data for the NPI Registry (`/api/`), PubMed esearch
+(`/entrez/eutils/esearch.fcgi`), paginated ClinicalTrials.gov v2
+(`/api/v2/studies`) and OpenAI chat completions (`POST /v1/chat/completions`,
+for clients pointed at it with OPENAI_BASE_URL).
+
+    python stub_server.py --port 8765
+    CLINICALTRIALS_API_BASE=http://127.0.0.1:8765/api/v2 python backend_data.py
+    NPI_API_URL=http://127.0.0.1:8765/api/ \
+    PUBMED_ESEARCH_URL=http://127.0.0.1:8765/entrez/eutils/esearch.fcgi \
+        uvicorn app.main:app --port 8001
+"""
+import argparse
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STATUSES = ["RECRUITING", "COMPLETED", "ACTIVE_NOT_RECRUITING", "TERMINATED", "COMPLETED"]
+CONDITIONS = ["Heart Failure", "Hypertension", "Atrial Fibrillation", "Diabetes", "Breast Cancer"]
+INTERVENTIONS = ["Drug: Placebo", "Drug: Metoprolol", "Device: Stent", "Behavioral: Exercise"]
+ROLES = ["PRINCIPAL_INVESTIGATOR", "STUDY_CHAIR", "STUDY_DIRECTOR"]
+FIRST_NAMES = ["JANE", "JOHN", "MARIA", "WEI", "PRIYA", "AHMED", "EMMA", "LUIS"]
+LAST_NAMES = ["DOE", "SMITH", "GARCIA", "CHEN", "PATEL", "KHAN", "JOHNSON", "LOPEZ"]
+TAXONOMIES = ["Cardiology", "Oncology", "Pediatrics", "Family Medicine", "Dermatology"]
+CITIES = [("BOSTON", "MA"), ("LOS ANGELES", "CA"), ("AUSTIN", "TX"), ("CHICAGO", "IL")]
+
+
+def _trial_count(term):
+    # Stable per-investigator volume (0-249) so paging is exercised
+    return zlib.crc32(term.encode()) % 250
+
+
+def _official_name(term):
+    # AREA[OverallOfficialName]"First Last" -> First Last
+    return term.split("]", 1)[-1].strip().strip('"') or "Unknown"
+
+
+def make_study(term, index):
+    return {
+        "protocolSection": {
+            "identificationModule": {"nctId": f"NCT{index:08d}"},
+            "statusModule": {"overallStatus": STATUSES[index % len(STATUSES)]},
+            "conditionsModule": {"conditions": [CONDITIONS[index % len(CONDITIONS)]]},
+            "armsInterventionsModule": {
+                "interventions": [{"name": INTERVENTIONS[index % len(INTERVENTIONS)]}]
+            },
+            "contactsLocationsModule": {
+                "overallOfficials": [{"name": _official_name(term), "role": ROLES[index % len(ROLES)]}]
+            },
+        }
+    }
+
+
+def studies_page(params):
+    term = params.get("query.term", [""])[0]
+    page_size = min(int(params.get("pageSize", ["10"])[0]), 1000)
+    start = int(params.get("pageToken", ["0"])[0])
+    total = _trial_count(term)
+    end = min(start + page_size, total)
+    body = {"studies": [make_study(term, i) for i in range(start, end)]}
+    if end < total:
+        body["nextPageToken"] = str(end)
+    return body
+
+
+def npi_registry(params):
+    number = params.get("number", [""])[0]
+    if not number:
+        return {"result_count": 0, "results": []}
+    seed = zlib.crc32(number.encode())
+    city, state = CITIES[seed % len(CITIES)]
+    return {
+        "result_count": 1,
+        "results": [{
+            "number": number,
+            "basic": {
+                "first_name": FIRST_NAMES[seed % len(FIRST_NAMES)],
+                "last_name": LAST_NAMES[(seed // 7) % len(LAST_NAMES)],
+                "credential": "MD",
+                "gender": "",
+            },
+            "addresses": [{
+                "address_purpose": "LOCATION",
+                "city": city,
+                "state": state,
+                "organization_name": f"{city.title()} Medical Center",
+            }],
+            "taxonomies": [{"desc": TAXONOMIES[seed % len(TAXONOMIES)], "primary": True}],
+        }],
+    }
+
+
+def pubmed_esearch(params):
+    term = params.get("term", [""])[0]
+    count = zlib.crc32(term.encode()) % 60
+    return {"esearchresult": {"count": str(count), "idlist": [str(30000000 + i) for i in range(min(count, 20))]}}
+
+
+def chat_completion(body):
+    # Echo a plausible answer: a JSON profile when JSON mode is requested, else one sentence
+    prompt = body["messages"][-1]["content"]
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps({
+            "fullName": "Stub Provider",
+            "specialty": TAXONOMIES[zlib.crc32(prompt.encode()) % len(TAXONOMIES)],
+            "location": "Boston, MA",
+            "topInterests": ["Research", "Education"],
+            "confidence": 80,
+            "summary": "Stub profile.",
+        })
+    else:
+        content = "Stub Provider is a clinician with an active research and teaching record."
+    return {
+        "id": f"chatcmpl-{zlib.crc32(prompt.encode())}",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+    }
+
+
+ROUTES = {
+    "/api/": npi_registry,
+    "/entrez/eutils/esearch.fcgi": pubmed_esearch,
+    "/api/v2/studies": studies_page,
+}
+POST_ROUTES = {
+    "/v1/chat/completions": chat_completion,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self.send_error(404)
+            return
+        self._send_json(route(parse_qs(url.query)))
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        route = POST_ROUTES.get(urlparse(self.path).path)
+        if route is None:
+            self.send_error(404)
+            return
+        self._send_json(route(body))
+
+    def _send_json(self, data):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0):
+    """Start the stub in a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local upstream API stub")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Stub upstreams on http://127.0.0.1:{args.port}")
+    server.serve_forever()